@@ -0,0 +1,400 @@
+import abc
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.utils.module_loading import import_string
+
+from coding.helpers import (
+    JOBE_COMPILE_ONCE,
+    JOBE_DRIVER_MAX_TESTCASES,
+    JOBE_MAX_CONCURRENCY,
+    JobeError,
+    get_c_driver_execution_results,
+    get_c_driver_run_payload,
+    get_c_execution_results,
+    get_c_testcase_result,
+    get_c_testcase_run_payload,
+    get_jobe_file_id,
+    get_jobe_file_payload,
+    get_jobe_files_url,
+    get_jobe_run_url,
+    get_js_batch_payload,
+    get_js_testcases_json,
+    get_node_vm_path,
+    parse_c_driver_response,
+    run_c_code_in_vm,
+    run_js_code_in_vm,
+)
+from courses.models import Exercise
+
+logger = logging.getLogger(__name__)
+
+# max number of JS submissions run by the same node process in a bulk run
+JS_MAX_BATCH_SIZE = 25
+
+
+class ExecutionBackend(abc.ABC):
+    """
+    Runs submitted code against the testcases of an exercise. Subclasses
+    implement `run`, and can override `run_many` to run several submissions
+    more efficiently than one at a time
+    """
+
+    def __init__(self, max_concurrency=None):
+        self.max_concurrency = max_concurrency or int(
+            os.environ.get("CODE_EXECUTION_MAX_CONCURRENCY", 4)
+        )
+
+    @abc.abstractmethod
+    def run(self, exercise, code, testcases, on_progress=None):
+        """
+        Runs the code against the testcases and returns the execution results.
+        If `on_progress` is given, it's called with the result of each testcase
+        as soon as it's available
+        """
+
+    def run_many(self, exercise, codes, testcases):
+        """
+        Runs each of the pieces of code against the testcases and returns a list
+        with their execution results. A failure only affects the results of the
+        code that caused it
+        """
+        return [self._run_or_fail(exercise, code, testcases) for code in codes]
+
+    def _run_or_fail(self, exercise, code, testcases):
+        try:
+            return self.run(exercise, code, testcases)
+        except Exception as e:
+            logger.critical("CODE EXECUTION EXCEPTION: %s", e, exc_info=1)
+            return {"state": "internal_error"}
+
+
+class SyncExecutionBackend(ExecutionBackend):
+    """
+    Runs code using blocking calls to the node worker pool and the Jobe server.
+    Several submissions are run using a pool of threads
+    """
+
+    def run(self, exercise, code, testcases, on_progress=None):
+        if exercise.exercise_type == Exercise.JS:
+            return run_js_code_in_vm(
+                code, testcases, exercise.requires_typescript, on_progress
+            )
+        if exercise.exercise_type == Exercise.C:
+            return run_c_code_in_vm(code, testcases, on_progress)
+
+        raise ValidationError("Non-coding exercise " + str(exercise.pk))
+
+    def run_many(self, exercise, codes, testcases):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(
+                executor.map(
+                    lambda code: self._run_or_fail(exercise, code, testcases), codes
+                )
+            )
+
+
+class AsyncExecutionBackend(ExecutionBackend):
+    """
+    Runs code using asyncio: node processes are run with
+    `asyncio.create_subprocess_exec` and requests to the Jobe server are sent
+    with an async HTTP client, so a single process can keep many jobs in
+    flight while waiting on I/O. Requires httpx.
+
+    Each process has an event loop, run by a thread of its own, and an HTTP
+    client whose connections are reused across runs: `run` and `run_many`
+    submit their jobs to the loop and wait for their results
+    """
+
+    def __init__(self, max_concurrency=None, job_timeout=None):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "AsyncExecutionBackend requires httpx to be installed"
+            ) from e
+
+        super().__init__(max_concurrency)
+        self.httpx = httpx
+        self.job_timeout = job_timeout or float(
+            os.environ.get("NODE_WORKER_JOB_TIMEOUT", 10)
+        )
+        self.node_worker_path = os.environ.get("NODE_WORKER_PATH", "coding/worker.js")
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._client = None
+
+    def run(self, exercise, code, testcases, on_progress=None):
+        return self._submit(
+            lambda client: self.arun(client, exercise, code, testcases, on_progress)
+        )
+
+    def run_many(self, exercise, codes, testcases):
+        if exercise.exercise_type == Exercise.JS:
+            return self._submit(lambda _: self.run_js_many(exercise, codes, testcases))
+
+        async def run_many(client):
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def run_one(code):
+                async with semaphore:
+                    try:
+                        return await self.arun(client, exercise, code, testcases)
+                    except Exception as e:
+                        logger.critical("CODE EXECUTION EXCEPTION: %s", e, exc_info=1)
+                        return {"state": "internal_error"}
+
+            return await asyncio.gather(*(run_one(code) for code in codes))
+
+        return self._submit(run_many)
+
+    def _submit(self, get_coroutine):
+        """
+        Runs the coroutine returned by `get_coroutine`, which is passed the
+        HTTP client of the process, in the event loop of the process and
+        returns its result
+        """
+        loop, client = self._get_loop()
+        return asyncio.run_coroutine_threadsafe(get_coroutine(client), loop).result()
+
+    def _get_loop(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # the loop of the parent process isn't run in forked processes, as
+                # threads don't survive a fork: start a new one
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                self._client = self._get_client()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="async-execution-backend",
+                    daemon=True,
+                ).start()
+            return self._loop, self._client
+
+    def _get_client(self):
+        return self.httpx.AsyncClient(
+            headers={"content-type": "application/json"},
+            limits=self.httpx.Limits(max_connections=JOBE_MAX_CONCURRENCY),
+            timeout=None,
+        )
+
+    async def report_progress(self, on_progress, test):
+        """
+        Passes the result of a testcase to `on_progress` in a thread of the
+        default executor: progress callbacks are regular functions, which can
+        block or use `async_to_sync`, neither of which can be done inside of
+        the event loop
+        """
+        if on_progress is not None:
+            await asyncio.get_running_loop().run_in_executor(None, on_progress, test)
+
+    async def arun(self, client, exercise, code, testcases, on_progress=None):
+        if exercise.exercise_type == Exercise.JS:
+            return await self.run_js(
+                code, testcases, exercise.requires_typescript, on_progress
+            )
+        if exercise.exercise_type == Exercise.C:
+            return await self.run_c(client, code, testcases, on_progress)
+
+        raise ValidationError("Non-coding exercise " + str(exercise.pk))
+
+    async def run_js(self, code, testcases, use_ts, on_progress=None):
+        # the worker script is run for a single request, so that its progress
+        # messages can be streamed
+        process = await asyncio.create_subprocess_exec(
+            "node",
+            self.node_worker_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        request = {
+            "id": 0,
+            "code": code,
+            "testcases": get_js_testcases_json(testcases),
+            "use_ts": use_ts,
+            "stream": on_progress is not None,
+        }
+        process.stdin.write((json.dumps(request) + "\n").encode())
+        await process.stdin.drain()
+        process.stdin.close()
+
+        async def read_outcome():
+            async for line in process.stdout:
+                message = json.loads(line)
+                if message.get("type") == "progress":
+                    await self.report_progress(on_progress, message["test"])
+                elif "outcome" in message:
+                    return message["outcome"]
+            raise RuntimeError("Node process exited without an outcome")
+
+        try:
+            outcome = await asyncio.wait_for(read_outcome(), self.job_timeout)
+        except asyncio.TimeoutError:
+            return {"execution_error": "Execution timed out", "state": "completed"}
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+        return {**outcome, "state": "completed"}
+
+    async def run_js_many(self, exercise, codes, testcases):
+        """
+        Splits the code into batches which are each run by a single node process,
+        with up to `max_concurrency` processes at once
+        """
+        testcases_json = get_js_testcases_json(testcases)
+        batch_size = min(
+            JS_MAX_BATCH_SIZE, math.ceil(len(codes) / self.max_concurrency) or 1
+        )
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(batch):
+            async with semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    "node",
+                    get_node_vm_path(),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                )
+                payload = get_js_batch_payload(
+                    batch, testcases_json, exercise.requires_typescript
+                )
+                try:
+                    stdout, _ = await asyncio.wait_for(
+                        process.communicate(payload.encode()),
+                        self.job_timeout * len(batch),
+                    )
+                    return [
+                        {**outcome, "state": "completed"}
+                        for outcome in json.loads(stdout)["results"]
+                    ]
+                except (asyncio.TimeoutError, ValueError, KeyError) as e:
+                    logger.warning("JS batch failed, running code one by one: %s", e)
+                finally:
+                    if process.returncode is None:
+                        process.kill()
+                        await process.wait()
+
+            # isolate the code that caused the batch to fail
+            return [
+                await self.run_js(code, testcases, exercise.requires_typescript)
+                for code in batch
+            ]
+
+        batches = [
+            codes[i : i + batch_size] for i in range(0, len(codes), batch_size)
+        ]
+        results = await asyncio.gather(*(run_batch(batch) for batch in batches))
+        return [r for batch_results in results for r in batch_results]
+
+    async def run_c(self, client, code, testcases, on_progress=None):
+        testcases = list(testcases)
+        if len(testcases) == 0:
+            return {"state": "completed"}
+
+        if JOBE_COMPILE_ONCE:
+            try:
+                responses = await self.run_c_compiled_once(client, code, testcases)
+            except (JobeError, self.httpx.HTTPError) as e:
+                logger.warning("Could not run driver on Jobe, running testcases: %s", e)
+            else:
+                results = get_c_driver_execution_results(testcases, responses)
+                # all testcases are run by the same Jobe run
+                for test in results.get("tests", []):
+                    await self.report_progress(on_progress, test)
+                return results
+
+        async def run_testcase(testcase):
+            response = await client.post(
+                get_jobe_run_url(), content=get_c_testcase_run_payload(code, testcase)
+            )
+            return testcase, response.json()
+
+        tasks = [asyncio.ensure_future(run_testcase(t)) for t in testcases]
+        responses = {}
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                testcase, response_body = await next_completed
+                if response_body["outcome"] == 11:
+                    # the code is the same for all testcases: don't wait for the others
+                    return {
+                        "compilation_errors": response_body["cmpinfo"],
+                        "state": "completed",
+                    }
+                responses[testcase.pk] = response_body
+                await self.report_progress(
+                    on_progress, get_c_testcase_result(testcase, response_body)
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return get_c_execution_results(testcases, responses)
+
+    async def run_c_compiled_once(self, client, code, testcases):
+        """
+        Async counterpart of `run_c_testcases_compiled_once`: testcases are split
+        across driver runs in the same way, and the runs are sent concurrently
+        """
+        file_id = get_jobe_file_id(code)
+        file_url = get_jobe_files_url() + "/" + file_id
+
+        async def upload():
+            response = await client.put(file_url, content=get_jobe_file_payload(code))
+            if response.status_code != 204:
+                raise JobeError("Could not upload file: " + str(response.status_code))
+
+        if (await client.head(file_url)).status_code != 204:
+            await upload()
+
+        async def run_batch(batch):
+            for attempt in range(2):
+                response = await client.post(
+                    get_jobe_run_url(),
+                    content=get_c_driver_run_payload(file_id, batch),
+                )
+                if response.status_code == 404 and attempt == 0:
+                    # the file has been evicted from Jobe's cache: upload it again
+                    await upload()
+                    continue
+                break
+
+            try:
+                response_body = (
+                    response.json() if response.status_code == 200 else None
+                )
+            except ValueError as e:
+                raise JobeError("Invalid response") from e
+            return parse_c_driver_response(response.status_code, response_body)
+
+        batches = [
+            testcases[i : i + JOBE_DRIVER_MAX_TESTCASES]
+            for i in range(0, len(testcases), JOBE_DRIVER_MAX_TESTCASES)
+        ]
+        ret = []
+        for responses in await asyncio.gather(*(run_batch(b) for b in batches)):
+            if isinstance(responses, dict):  # compilation error
+                return responses
+            ret.extend(responses)
+
+        return ret
+
+_backend = None
+
+
+def get_execution_backend():
+    global _backend
+
+    if _backend is None:
+        _backend = import_string(settings.CODE_EXECUTION_BACKEND)()
+    return _backend
@@ -0,0 +1,96 @@
+"""
+Driver run on the Jobe server as a python3 job: compiles the C source found in
+the job's file list once, then runs the resulting program against every
+testcase. The stdin of each testcase is read as a JSON list from the job's
+stdin, and the results are written to stdout as a JSON object
+"""
+import json
+import signal
+import subprocess
+import sys
+
+SOURCE_FILE = "prog.c"
+EXECUTABLE = "./prog"
+COMPILE_ARGS = ["-Wall", "-Werror", "-std=c99", "-x", "c"]
+LINK_ARGS = ["-lm"]
+TESTCASE_TIMEOUT = 3
+
+# same outcome codes as the Jobe API
+COMPILATION_ERROR = 11
+RUNTIME_ERROR = 12
+TIME_LIMIT_EXCEEDED = 13
+OK = 15
+MEMORY_LIMIT_EXCEEDED = 17
+
+# signals sent to programs that exceed their cpu time or file size limits
+TIME_LIMIT_SIGNALS = [signal.SIGXCPU]
+
+
+def compile_source():
+    return subprocess.run(
+        ["gcc", *COMPILE_ARGS, SOURCE_FILE, "-o", EXECUTABLE, *LINK_ARGS],
+        capture_output=True,
+        text=True,
+    )
+
+
+def to_text(output):
+    # partial output of timed out processes is returned as bytes
+    if isinstance(output, bytes):
+        return output.decode(errors="replace")
+    return output or ""
+
+
+def get_outcome(returncode):
+    """
+    Returns the outcome that Jobe gives to a run of a program that exited with
+    the given code, which is negative if the program was killed by a signal
+    """
+    if returncode == 0:
+        return OK
+    if -returncode in TIME_LIMIT_SIGNALS:
+        return TIME_LIMIT_EXCEEDED
+    return RUNTIME_ERROR
+
+
+def run_testcase(stdin):
+    try:
+        result = subprocess.run(
+            [EXECUTABLE],
+            input=stdin,
+            capture_output=True,
+            text=True,
+            errors="replace",
+            timeout=TESTCASE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired as e:
+        return {
+            "outcome": TIME_LIMIT_EXCEEDED,
+            "stdout": to_text(e.stdout),
+            "stderr": to_text(e.stderr),
+        }
+    except MemoryError:
+        # the output of the program doesn't fit in the memory of the driver
+        return {"outcome": MEMORY_LIMIT_EXCEEDED, "stdout": "", "stderr": ""}
+
+    return {
+        "outcome": get_outcome(result.returncode),
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+    }
+
+
+def main():
+    stdins = json.loads(sys.stdin.read())
+
+    compilation = compile_source()
+    if compilation.returncode != 0:
+        ret = {"outcome": COMPILATION_ERROR, "cmpinfo": compilation.stderr}
+    else:
+        ret = {"outcome": OK, "runs": [run_testcase(stdin) for stdin in stdins]}
+
+    sys.stdout.write(json.dumps(ret))
+
+
+if __name__ == "__main__":
+    main()
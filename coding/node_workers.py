@@ -0,0 +1,219 @@
+import itertools
+import json
+import os
+import select
+import subprocess
+import threading
+import time
+
+
+class NodeWorkerError(Exception):
+    pass
+
+
+class NodeWorkerTimeout(NodeWorkerError):
+    pass
+
+
+class NodeWorker:
+    """
+    A long-lived Node process running coding/worker.js, which receives submissions
+    on its stdin and writes their outcome on its stdout, one JSON object per line
+    """
+
+    def __init__(self, script_path):
+        self.process = subprocess.Popen(
+            ["node", script_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.jobs_count = 0
+        self.last_used = time.monotonic()
+        self._buffer = b""
+        self._request_ids = itertools.count()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.is_alive():
+            self.process.kill()
+        self.process.wait()
+
+    def request(self, payload, timeout, on_progress=None):
+        """
+        Sends a request to the worker and returns its response. Raises
+        NodeWorkerTimeout if no response is received within `timeout` seconds.
+        Progress messages sent by the worker before the response are passed
+        to `on_progress`, if given
+        """
+        request_id = next(self._request_ids)
+        try:
+            self.process.stdin.write(
+                (json.dumps({**payload, "id": request_id}) + "\n").encode()
+            )
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise NodeWorkerError("Could not write to worker") from e
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = json.loads(self._read_line(deadline))
+            except ValueError:
+                # not a response to a request: ignore it
+                continue
+            if not isinstance(response, dict) or response.get("id") != request_id:
+                continue
+            if response.get("type") == "progress":
+                if on_progress is not None:
+                    on_progress(response["test"])
+                continue
+            self.last_used = time.monotonic()
+            return response
+
+    def ping(self, timeout):
+        try:
+            return self.request({"type": "ping"}, timeout).get("type") == "pong"
+        except NodeWorkerError:
+            return False
+
+    def run(self, payload, timeout, on_progress=None):
+        response = self.request(
+            {**payload, "stream": on_progress is not None}, timeout, on_progress
+        )
+        self.jobs_count += 1
+        return response["outcome"]
+
+    def _read_line(self, deadline):
+        stdout = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise NodeWorkerTimeout("Worker didn't respond in time")
+            readable, _, _ = select.select([stdout], [], [], remaining)
+            if not readable:
+                continue
+            data = os.read(stdout, 65536)
+            if not data:
+                raise NodeWorkerError("Worker exited")
+            self._buffer += data
+
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line
+
+
+class NodeWorkerPool:
+    """
+    A pool of NodeWorker's shared by the threads of a process.
+
+    Workers are created lazily, health-checked before being reused if they've
+    been idle for a while, killed if a job exceeds its timeout, and recycled
+    after running a given number of jobs. After each job, workers are pinged
+    before being returned to the pool, and killed if they don't answer: a job
+    can keep a worker busy after it's responded, e.g. by leaving behind a loop
+    of microtasks. If the process is forked (e.g. by celery's prefork pool) the
+    child process starts with a pool of its own
+    """
+
+    def __init__(
+        self,
+        script_path,
+        size=4,
+        max_jobs_per_worker=500,
+        job_timeout=10,
+        health_check_interval=30,
+        release_check_timeout=1,
+    ):
+        self.script_path = script_path
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.job_timeout = job_timeout
+        self.health_check_interval = health_check_interval
+        self.release_check_timeout = release_check_timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle_workers = []
+
+    def _acquire(self):
+        if self._pid != os.getpid():
+            # the workers belong to the parent process, which is the only one
+            # that can communicate with them
+            self._reset()
+
+        self._slots.acquire()
+        while True:
+            with self._lock:
+                worker = self._idle_workers.pop() if self._idle_workers else None
+            if worker is None:
+                try:
+                    return NodeWorker(self.script_path)
+                except OSError as e:
+                    self._slots.release()
+                    raise NodeWorkerError("Could not start worker") from e
+            if self._is_healthy(worker):
+                return worker
+            worker.kill()
+
+    def _release(self, worker, discard=False):
+        if (
+            discard
+            or worker.jobs_count >= self.max_jobs_per_worker
+            or not worker.ping(timeout=self.release_check_timeout)
+        ):
+            worker.kill()
+        else:
+            with self._lock:
+                self._idle_workers.append(worker)
+        self._slots.release()
+
+    def _is_healthy(self, worker):
+        if not worker.is_alive():
+            return False
+        if time.monotonic() - worker.last_used < self.health_check_interval:
+            return True
+        return worker.ping(timeout=1)
+
+    def run(self, payload, on_progress=None):
+        """
+        Runs a job on one of the workers of the pool and returns its outcome.
+        If `on_progress` is given, it's called with the result of each test
+        case as soon as the worker reports it
+        """
+        worker = self._acquire()
+        try:
+            outcome = worker.run(payload, self.job_timeout, on_progress)
+        except NodeWorkerError:
+            # the state of the worker is unknown after a failure
+            self._release(worker, discard=True)
+            raise
+        self._release(worker)
+        return outcome
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle_workers = self._idle_workers, []
+        for worker in workers:
+            worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_node_worker_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = NodeWorkerPool(
+                os.environ.get("NODE_WORKER_PATH", "coding/worker.js"),
+                size=int(os.environ.get("NODE_WORKER_POOL_SIZE", 4)),
+                max_jobs_per_worker=int(os.environ.get("NODE_WORKER_MAX_JOBS", 500)),
+                job_timeout=float(os.environ.get("NODE_WORKER_JOB_TIMEOUT", 10)),
+            )
+    return _pool
@@ -0,0 +1,140 @@
+// The VM2 module allows execution of arbitrary code safely using
+// a sandboxed, secure virtual machine
+const { VM } = require("vm2");
+const assert = require("assert");
+const AssertionError = require("assert").AssertionError;
+const compileTsToJs = require("./tsCompilation").tsToJs;
+const utils = require("./utils");
+
+const SANDBOX_TIMEOUT = utils.SANDBOX_TIMEOUT;
+
+function getProgramIdentifiers() {
+  // rename assert and AssertionError inside generated program to make them inaccessible to user
+  return {
+    assert: utils.getRandomIdentifier(20),
+    assertionError: utils.getRandomIdentifier(20),
+    prettyPrintError: utils.getRandomIdentifier(20),
+    prettyPrintAssertionError: utils.getRandomIdentifier(20),
+    reportTestcase: utils.getRandomIdentifier(20),
+    testcaseReporter: utils.getRandomIdentifier(20),
+    outputArr: utils.getRandomIdentifier(32),
+    testDetailsObj: utils.getRandomIdentifier(32),
+    testcaseCounter: utils.getRandomIdentifier(32),
+  };
+}
+
+// TS programs are built using the same identifiers for the whole lifetime of
+// the process, so that compiling the same submission again hits the compilation
+// cache. The globals they name can be enumerated by user code anyway, and the
+// test case reporter is removed from the globals before user code runs
+const COMPILATION_IDENTIFIERS = getProgramIdentifiers();
+
+function getMachineProgram(userCode, testcases, compileFromTs, ids) {
+  // turn array of strings representing assertions to a series of try-catch blocks
+  //  where those assertions are evaluated and the result is pushed to an array
+  // the resulting string will be inlined into the program that the vm will run
+  const assertionString =
+    `let ${ids.testcaseCounter} = 0;` +
+    testcases
+      .map(
+        (a) =>
+          `
+        var ${ids.testDetailsObj}${compileFromTs ? ":any" : ""} = {
+            id: \`${a.id}\`,
+        }
+        try {
+            // run the assertion
+
+            ${a.assertion.replace(/assert/g, ids.assert)}
+
+            ${ids.testDetailsObj}.passed = true // if no exception is thrown, the test case passed
+        } catch(e) {
+            ${ids.testDetailsObj}.passed = false
+            if(e instanceof ${ids.assertionError}) {
+                ${ids.testDetailsObj}.error = ${ids.prettyPrintAssertionError}(e) // test case failed but cose threw no errors
+            } else {
+                ${ids.testDetailsObj}.error = ${ids.prettyPrintError}(e) // code threw an error during test case execution
+            }
+        }
+        ${ids.outputArr}[${ids.testcaseCounter}++] = ${ids.testDetailsObj} // push test case results
+        ${ids.reportTestcase}(${ids.testDetailsObj}.id, ${ids.testDetailsObj}.passed, ${ids.testDetailsObj}.error)
+    `
+      )
+      .join("");
+
+  // the reporter of test cases is only reachable through a binding that user
+  // code can't enumerate: it's removed from the globals before user code runs,
+  // so that it can't be called, or replaced, to forge results
+  return `const ${ids.outputArr}${compileFromTs ? ":any" : ""} = []; const ${
+    ids.reportTestcase
+  } = ${ids.testcaseReporter}; delete (globalThis${
+    compileFromTs ? " as any" : ""
+  }).${ids.testcaseReporter};
+${userCode}
+// USER CODE ENDS HERE
+if(Object.isFrozen(${ids.outputArr})) {
+    // abort if user intentionally froze the output array
+    throw new Error("Internal error")
+}
+// inline assertions
+${assertionString}
+// output outcome object to console
+${ids.outputArr}`;
+}
+
+// runs a user-submitted program against the given test cases inside of a
+// fresh vm and returns the outcome object that is sent back to Django.
+// If given, onTestcase is called with the result of each test case as soon
+// as it's been run
+function runSubmission(userCode, testcases, compileFromTs, onTestcase) {
+  const ids = compileFromTs ? COMPILATION_IDENTIFIERS : getProgramIdentifiers();
+
+  // instantiation of the vm that'll run the user-submitted program
+  const safeVm = new VM({
+    timeout: SANDBOX_TIMEOUT, // set timeout to prevent endless loops from running forever
+    sandbox: {
+      [ids.prettyPrintError]: utils.prettyPrintError,
+      [ids.prettyPrintAssertionError]: utils.prettyPrintAssertionError,
+      [ids.assert]: assert,
+      [ids.assertionError]: AssertionError,
+      // only primitive values cross the vm boundary
+      [ids.testcaseReporter]: (id, passed, error) =>
+        onTestcase?.({ id, passed, ...(error === undefined ? {} : { error }) }),
+    },
+  });
+
+  let machineProgram;
+  if (compileFromTs) {
+    const vmIdentifiers = [
+      ids.assert,
+      ids.assertionError,
+      ids.prettyPrintError,
+      ids.prettyPrintAssertionError,
+      ids.testcaseReporter,
+    ];
+    const compilationResult = compileTsToJs(
+      getMachineProgram(userCode, testcases, compileFromTs, ids),
+      vmIdentifiers
+    );
+    if (compilationResult.compilationErrors.length > 0) {
+      return {
+        compilation_errors: compilationResult.compilationErrors,
+      };
+    }
+    machineProgram = compilationResult.compiledCode;
+  } else {
+    machineProgram = getMachineProgram(userCode, testcases, compileFromTs, ids);
+  }
+
+  try {
+    const outcome = safeVm.run(machineProgram); // run program
+    return { tests: outcome };
+  } catch (e) {
+    // an error occurred before any test cases could be ran
+    return { execution_error: utils.prettyPrintError(e) };
+  }
+}
+
+module.exports = {
+  runSubmission,
+};
@@ -1,29 +1,36 @@
+// Compiles TypeScript programs in memory. The standard library declaration files
+// are parsed once per process and shared by all compilations, and the output of
+// each compilation is cached by the hash of its source, so no temporary files
+// are written and recompiling the same program is free
 const ts = require("typescript");
+const crypto = require("crypto");
 const tsConfig = require("./tsconfig.json");
-const fs = require("fs");
 const getRandomIdentifier = require("./utils").getRandomIdentifier;
 
 const ENV_DECLARATION_SEPARATOR = "/*" + getRandomIdentifier(20) + "*/";
 
-function createTsSourceFile(filename, source) {
-  fs.writeFileSync(filename, source);
-  return filename;
-}
+// name of the in-memory file holding the program being compiled
+const SOURCE_FILE_NAME = "/__submission__.ts";
 
-function deleteTmpFiles(filename) {
-  try {
-    fs.unlinkSync(getAbsoluteTmpFilePath(filename) + ".ts");
-    fs.unlinkSync(getAbsoluteTmpFilePath(filename) + ".js");
-  } catch {}
-}
+// max number of compilation results kept in memory
+const OUTPUT_CACHE_SIZE = 500;
 
-function getAbsoluteTmpFilePath(filename) {
-  return getTmpFileDir() + filename;
-}
+const compilerOptions = {
+  ...ts.convertCompilerOptionsFromJson(tsConfig.compilerOptions, __dirname)
+    .options,
+  // lib entries in tsconfig.json are already file names
+  lib: tsConfig.compilerOptions.lib,
+  // don't look up type declarations on disk
+  types: [],
+};
 
-function getTmpFileDir() {
-  return __dirname + "/tmp/";
-}
+const defaultCompilerHost = ts.createCompilerHost(compilerOptions);
+
+// parsed lib.*.d.ts files, shared by all compilations
+const libSourceFiles = new Map();
+
+// compilation results by hash of the compiled source
+const outputCache = new Map();
 
 function addEnvironmentDeclarations(source, environment) {
   if (!environment || environment.length === 0) {
@@ -37,31 +44,42 @@ function addEnvironmentDeclarations(source, environment) {
   return envDeclarations + "\n" + ENV_DECLARATION_SEPARATOR + "\n" + source;
 }
 
-function compile(source, options, environment) {
-  const filename = getRandomIdentifier(20);
-  const filepath = getAbsoluteTmpFilePath(filename) + ".ts";
-
-  if (!fs.existsSync(getTmpFileDir())) {
-    fs.mkdirSync(getTmpFileDir(), 0744, { recursive: true });
-  }
-
-  // add dummy declarations for the identifiers in `environment` to prevent compilation errors
-  const sourceWithEnvironmentDeclarations = addEnvironmentDeclarations(
-    source,
-    environment
-  );
-
-  createTsSourceFile(filepath, sourceWithEnvironmentDeclarations);
-
-  const defaultCompilerHost = ts.createCompilerHost({});
-  const program = ts.createProgram([filepath], options, defaultCompilerHost);
-  const emitResult = program.emit();
-
-  const allDiagnostics = ts
-    .getPreEmitDiagnostics(program)
-    .concat(emitResult.diagnostics);
+function createInMemoryCompilerHost(source, output) {
+  return {
+    ...defaultCompilerHost,
+    getSourceFile(fileName, languageVersion) {
+      if (fileName === SOURCE_FILE_NAME) {
+        return ts.createSourceFile(fileName, source, languageVersion);
+      }
+      if (!libSourceFiles.has(fileName)) {
+        libSourceFiles.set(
+          fileName,
+          defaultCompilerHost.getSourceFile(fileName, languageVersion)
+        );
+      }
+      return libSourceFiles.get(fileName);
+    },
+    fileExists(fileName) {
+      return (
+        fileName === SOURCE_FILE_NAME ||
+        defaultCompilerHost.fileExists(fileName)
+      );
+    },
+    readFile(fileName) {
+      return fileName === SOURCE_FILE_NAME
+        ? source
+        : defaultCompilerHost.readFile(fileName);
+    },
+    writeFile(fileName, text) {
+      if (fileName.endsWith(".js")) {
+        output.code = text;
+      }
+    },
+  };
+}
 
-  const processedDiagnostics = allDiagnostics
+function formatDiagnostics(diagnostics) {
+  return diagnostics
     .map((diagnostic) => {
       if (diagnostic.file) {
         let { line, character } = ts.getLineAndCharacterOfPosition(
@@ -80,15 +98,33 @@ function compile(source, options, environment) {
       }
     })
     .join("\n\n");
+}
+
+function compile(source, options, environment) {
+  // add dummy declarations for the identifiers in `environment` to prevent compilation errors
+  const sourceWithEnvironmentDeclarations = addEnvironmentDeclarations(
+    source,
+    environment
+  );
+
+  const output = {};
+  const program = ts.createProgram(
+    [SOURCE_FILE_NAME],
+    options,
+    createInMemoryCompilerHost(sourceWithEnvironmentDeclarations, output)
+  );
+  const emitResult = program.emit();
+
+  const processedDiagnostics = formatDiagnostics(
+    ts.getPreEmitDiagnostics(program).concat(emitResult.diagnostics)
+  );
 
   const res = {
     compilationErrors: processedDiagnostics,
   };
 
   if (processedDiagnostics.length === 0) {
-    res.compiledCode = String(
-      fs.readFileSync(getAbsoluteTmpFilePath(filename) + ".js")
-    );
+    res.compiledCode = output.code;
     if (environment && environment.length > 0) {
       // strip first line containing dummy declarations from the environment
       const declarationLine = res.compiledCode.split(
@@ -100,12 +136,35 @@ function compile(source, options, environment) {
     }
   }
 
-  deleteTmpFiles(filename);
   return res;
 }
 
-const tsToJs = (source, environment) =>
-  compile(source, tsConfig.compilerOptions, environment);
+function getCacheKey(source, environment) {
+  return crypto
+    .createHash("sha256")
+    .update(JSON.stringify([source, environment ?? []]))
+    .digest("hex");
+}
+
+function tsToJs(source, environment) {
+  const cacheKey = getCacheKey(source, environment);
+  if (outputCache.has(cacheKey)) {
+    const res = outputCache.get(cacheKey);
+    // move the entry to the end of the cache, as it's the most recently used
+    outputCache.delete(cacheKey);
+    outputCache.set(cacheKey, res);
+    return res;
+  }
+
+  const res = compile(source, compilerOptions, environment);
+
+  outputCache.set(cacheKey, res);
+  if (outputCache.size > OUTPUT_CACHE_SIZE) {
+    // evict the least recently used entry
+    outputCache.delete(outputCache.keys().next().value);
+  }
+  return res;
+}
 
 module.exports = {
   tsToJs,
@@ -0,0 +1,51 @@
+// Long-lived process that runs user-submitted programs on behalf of Django.
+// Requests are read from stdin and responses are written to stdout, one JSON
+// object per line. Each program runs inside of its own fresh vm, so the
+// worker can be reused for many submissions without them sharing any state.
+// If a request has the `stream` flag, the result of each test case is also
+// sent as a "progress" message as soon as it's available
+const readline = require("readline");
+const { runSubmission } = require("./sandbox");
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + "\n");
+}
+
+const requests = readline.createInterface({
+  input: process.stdin,
+  terminal: false,
+});
+
+requests.on("line", (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (e) {
+    send({ id: null, error: "Malformed request" });
+    return;
+  }
+
+  if (request.type === "ping") {
+    // health check
+    send({ id: request.id, type: "pong" });
+    return;
+  }
+
+  let outcome;
+  try {
+    outcome = runSubmission(
+      request.code,
+      request.testcases,
+      request.use_ts ?? false,
+      request.stream
+        ? (test) => send({ id: request.id, type: "progress", test })
+        : undefined
+    );
+  } catch (e) {
+    outcome = { execution_error: String(e) };
+  }
+  send({ id: request.id, outcome });
+});
+
+// the Django process closed the pipe: exit
+requests.on("close", () => process.exit(0));
@@ -4,6 +4,8 @@ from django.contrib.auth.models import AnonymousUser
 from django.utils import timezone
 from oauth2_provider.models import AccessToken
 
+from courses.logic.privileges import privileges_cache
+
 
 @database_sync_to_async
 def get_user(token_key):
@@ -24,3 +26,16 @@ class TokenAuthMiddleware(BaseMiddleware):
         token_key = query.get("token")
         scope["user"] = await get_user(token_key)
         return await super().__call__(scope, receive, send)
+
+
+class PrivilegesCacheMiddleware:
+    """
+    Memoizes users' privileges for the duration of each request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with privileges_cache():
+            return self.get_response(request)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 import os
 from pathlib import Path
+from kombu import Queue
 from oauth2_provider import settings as oauth2_settings
 
 
@@ -73,6 +74,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.PrivilegesCacheMiddleware",
 ]
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -208,3 +210,27 @@ MEDIA_URL = os.environ.get("MEDIA_URL", "/media/")
 
 CELERY_RESULT_BACKEND = "django-db"
 CELERY_BROKER_URL = os.environ.get("RABBITMQ_URL", "amqp://localhost:5672")
+# dotted path of the class used to run code submissions; set to
+# coding.backends.AsyncExecutionBackend to use asyncio (requires httpx)
+CODE_EXECUTION_BACKEND = os.environ.get(
+    "CODE_EXECUTION_BACKEND", "coding.backends.SyncExecutionBackend"
+)
+
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+# code execution has queues of its own, so that it can't starve other tasks
+# and is split by language; code_js and code_c support message priorities
+CELERY_TASK_QUEUES = (
+    Queue("celery"),
+    Queue("code_js", queue_arguments={"x-max-priority": 10}),
+    Queue("code_c", queue_arguments={"x-max-priority": 10}),
+    Queue("code_bulk"),
+)
+CELERY_TASK_ROUTES = {
+    "courses.tasks.bulk_run_user_code_task": {"queue": "code_bulk"},
+}
+CELERY_BEAT_SCHEDULE = {
+    "update-event-states": {
+        "task": "courses.tasks.update_event_states_task",
+        "schedule": 60.0,  # seconds
+    },
+}
@@ -103,4 +103,11 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL"),
+    }
+}
+
 CSRF_TRUSTED_ORIGINS = ["https://*.di.unipi.it"]
@@ -23,7 +23,10 @@ class TrackFieldsMixin(models.Model):
     def from_db(cls, db, field_names, values):
         instance = super().from_db(db, field_names, values)
         for fieldname in cls.TRACKED_FIELDS:
-            setattr(instance, f"_old_{fieldname}", getattr(instance, fieldname))
+            # deferred fields aren't tracked, as accessing them would
+            # cause them to be loaded from the db
+            if fieldname in field_names:
+                setattr(instance, f"_old_{fieldname}", getattr(instance, fieldname))
 
         return instance
 
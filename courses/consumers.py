@@ -36,6 +36,7 @@ from courses.logic.privileges import (
     MANAGE_EXERCISES,
     UPDATE_COURSE,
     check_privilege,
+    privileges_cache,
 )
 from courses.models import (
     Event,
@@ -71,8 +72,29 @@ class ChannelLayer(RedisChannelLayer):
         return random_prefix + value
 
 
-class BaseObserverConsumer(ObserverModelInstanceMixin, GenericAsyncAPIConsumer):
+def get_code_execution_group_name(prefix, pk):
+    # group of the consumers subscribed to the progress of a bulk code execution
+    return f"{prefix}_code_execution_{pk}"
+
+
+class PrivilegesCacheMixin:
+    """
+    Memoizes users' privileges while each message received by the consumer is
+    handled; the memo isn't kept for the lifetime of the connection, which would
+    keep stale privileges around after they're changed
+    """
+
+    async def dispatch(self, message):
+        with privileges_cache():
+            return await super().dispatch(message)
+
+
+class BaseObserverConsumer(
+    PrivilegesCacheMixin, ObserverModelInstanceMixin, GenericAsyncAPIConsumer
+):
     LOCK_BY_DEFAULT = True
+    # prefix of the groups receiving progress of bulk code executions
+    CODE_EXECUTION_GROUP_PREFIX = None
 
     def __init__(self, *args, **kwargs):
         self.subscribed_instances = []
@@ -99,6 +121,13 @@ class BaseObserverConsumer(ObserverModelInstanceMixin, GenericAsyncAPIConsumer):
 
             response = await super().subscribe_instance(request_id, **kwargs)
             self.subscribed_instances.append(pk)
+            if self.CODE_EXECUTION_GROUP_PREFIX is not None:
+                await self.channel_layer.group_add(
+                    get_code_execution_group_name(
+                        self.CODE_EXECUTION_GROUP_PREFIX, pk
+                    ),
+                    self.channel_name,
+                )
         except:
             await database_sync_to_async(self.unlock_instance_or_give_up)(pk)
 
@@ -118,6 +147,14 @@ class BaseObserverConsumer(ObserverModelInstanceMixin, GenericAsyncAPIConsumer):
     async def encode_json(cls, content):
         return json.dumps(content, cls=CustomEncoder)
 
+    async def code_execution_progress(self, event):
+        await self.send_json(
+            {
+                "action": "code_execution_progress",
+                "data": event["payload"],
+            }
+        )
+
     async def websocket_disconnect(self, message):
         for pk in self.locked_instances:
             await database_sync_to_async(self.unlock_instance_or_give_up)(pk)
@@ -126,6 +163,7 @@ class BaseObserverConsumer(ObserverModelInstanceMixin, GenericAsyncAPIConsumer):
 
 
 class EventConsumer(BaseObserverConsumer):
+    CODE_EXECUTION_GROUP_PREFIX = "event"
     queryset = Event.objects.all()
     serializer_class = serializers.EventSerializer
     permission_classes = (permissions.IsAuthenticated,)
@@ -153,6 +191,7 @@ class EventConsumer(BaseObserverConsumer):
 
 
 class ExerciseConsumer(BaseObserverConsumer):
+    CODE_EXECUTION_GROUP_PREFIX = "exercise"
     queryset = Exercise.objects.all()
     serializer_class = serializers.ExerciseSerializer
     permission_classes = (permissions.IsAuthenticated,)
@@ -178,7 +217,7 @@ class ExerciseConsumer(BaseObserverConsumer):
         return await super().check_permissions(action, **kwargs)
 
 
-class SubmissionSlotConsumer(AsyncWebsocketConsumer):
+class SubmissionSlotConsumer(PrivilegesCacheMixin, AsyncWebsocketConsumer):
     queryset = EventParticipationSlot.objects.all()
 
     async def receive(self, text_data=None, bytes_data=None):
@@ -188,19 +227,6 @@ class SubmissionSlotConsumer(AsyncWebsocketConsumer):
         else:
             print("unknown message", text_data)
 
-    async def task_message(self, payload):
-        if payload["action"] == "execution_complete":
-            slot = await database_sync_to_async(self.queryset.get)(pk=payload["pk"])
-            await self.channel_layer.group_send(
-                "submission_slot_" + str(payload["pk"]),
-                {
-                    "type": "execution.results",
-                    "payload": slot.execution_results,
-                },
-            )
-        else:
-            print("unknown action", payload)
-
     async def subscribe_instance(self, pk):
         if pk is not None and await self.check_permissions(pk=pk):
             await self.channel_layer.group_add(
@@ -227,3 +253,13 @@ class SubmissionSlotConsumer(AsyncWebsocketConsumer):
                 }
             )
         )
+
+    async def execution_progress(self, event):
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "action": "execution_progress",
+                    "data": event["payload"],
+                }
+            )
+        )
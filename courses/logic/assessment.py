@@ -1,5 +1,8 @@
+from collections import defaultdict
 from decimal import Decimal
 
+from django.db.models import Case, Q, Value, When
+
 
 def get_assessor_class(event):
     from courses.models import Event
@@ -11,9 +14,17 @@ def get_assessor_class(event):
 
 
 class SubmissionAssessor:
-    def __init__(self, participation_slot):
+    def __init__(self, participation_slot, sub_slots=None):
         self.participation_slot = participation_slot
         self.slot_weight = self.participation_slot.populating_rule.weight
+        # optional dict mapping the pk of slots to the list of their
+        # sub-slots, used instead of querying the sub-slots of each slot
+        self.sub_slots = sub_slots
+
+    def get_sub_slots(self, slot):
+        if self.sub_slots is not None:
+            return self.sub_slots[slot.pk]
+        return slot.sub_slots.all()
 
     def get_multiple_choice_submission_correctness(self, slot):
         selected_choices = slot.selected_choices.all()
@@ -39,7 +50,7 @@ class SubmissionAssessor:
         # for composite exercises (i.e. COMPLETION, AGGREGATED) the correctness
         # is the sum of the correctness values of the sub-exercises
         sub_slots_correctness = [
-            (s, self.get_submission_correctness(s)) for s in slot.sub_slots.all()
+            (s, self.get_submission_correctness(s)) for s in self.get_sub_slots(slot)
         ]
         if any([c is None for _, c in sub_slots_correctness]):
             return None
@@ -124,3 +135,105 @@ class BestEffortAutomaticAssessor(SubmissionAssessor):
     """
 
     pass
+
+
+# max number of rows written by each of the queries that store the scores
+# computed by BatchAssessor
+SCORES_UPDATE_BATCH_SIZE = 500
+
+
+def update_auto_scores_if_unchanged(model, objects):
+    """
+    Stores the `_auto_score` of the given slots or participations, and marks it
+    as up to date, in bulk. Like in their `update_auto_score` method, the score
+    of an object isn't stored if the object has been marked as outdated since it
+    was loaded, i.e. if its `_auto_score_version` has changed
+    """
+    for i in range(0, len(objects), SCORES_UPDATE_BATCH_SIZE):
+        batch = objects[i : i + SCORES_UPDATE_BATCH_SIZE]
+        unchanged = Q()
+        for obj in batch:
+            unchanged |= Q(pk=obj.pk, _auto_score_version=obj._auto_score_version)
+        model.objects.filter(unchanged).update(
+            _auto_score=Case(
+                *[When(pk=obj.pk, then=Value(obj._auto_score)) for obj in batch],
+                output_field=model._meta.get_field("_auto_score"),
+            ),
+            _auto_score_outdated=False,
+        )
+
+
+class BatchAssessor:
+    """
+    Assesses all the assigned participations to an event in one pass: slots,
+    their exercises, rules, and selected choices are loaded with a fixed number
+    of queries, and the resulting scores are written back in bulk
+    """
+
+    def __init__(self, event):
+        self.event = event
+        self.assessor_class = get_assessor_class(event)
+
+    def get_participations(self):
+        from courses.models import EventParticipation
+
+        # pre-generated participations that haven't been claimed by any user
+        # have no answers to assess
+        return EventParticipation.objects.filter(event=self.event).assigned()
+
+    def get_slots(self):
+        from courses.models import EventParticipationSlot
+
+        return (
+            EventParticipationSlot.objects.filter(
+                participation__in=self.get_participations()
+            )
+            .select_related("exercise", "populating_rule")
+            .prefetch_related("selected_choices")
+        )
+
+    def assess(self):
+        """
+        Computes the scores of all the slots and participations to the event and
+        stores them. Returns a dict mapping the pk of each participation to its score
+        """
+        from courses.models import EventParticipation, EventParticipationSlot
+
+        # participations are loaded before their slots: if a slot is marked as
+        # outdated in between, so is its participation, whose score then isn't
+        # stored either
+        participations = list(
+            self.get_participations().only("pk", "_auto_score_version")
+        )
+        slots = list(self.get_slots())
+
+        sub_slots = defaultdict(list)
+        base_slots = []
+        exercises = {}
+        for slot in slots:
+            # slots share the instances of their exercises, whose max score is
+            # then computed at most once for all the participations
+            slot.exercise = exercises.setdefault(slot.exercise_id, slot.exercise)
+            if slot.parent_id is None:
+                base_slots.append(slot)
+            else:
+                # sub-slots don't have a weight of their own, hence a score: their
+                # correctness is accounted for in the score of their parent
+                slot._auto_score = None
+                sub_slots[slot.parent_id].append(slot)
+
+        participation_scores = {p.pk: Decimal(0) for p in participations}
+        for slot in base_slots:
+            score = self.assessor_class(slot, sub_slots=sub_slots).assess()
+            slot._auto_score = round(Decimal(score), 2) if score is not None else None
+
+            slot_score = slot._score if slot._score is not None else slot._auto_score
+            participation_scores[slot.participation_id] += slot_score or 0
+
+        for participation in participations:
+            participation._auto_score = round(participation_scores[participation.pk], 2)
+
+        update_auto_scores_if_unchanged(EventParticipationSlot, slots)
+        update_auto_scores_if_unchanged(EventParticipation, participations)
+
+        return {p.pk: p._auto_score for p in participations}
@@ -0,0 +1,109 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# queues code execution tasks are routed to
+JS_QUEUE = "code_js"
+C_QUEUE = "code_c"
+BULK_QUEUE = "code_bulk"
+
+# priorities of code execution tasks inside of their queue
+HIGH_PRIORITY = 9  # live exams
+NORMAL_PRIORITY = 5  # practice and assignments
+
+# max number of code runs a user can have queued or running at once
+MAX_IN_FLIGHT_RUNS_PER_USER = int(os.environ.get("CODE_RUNS_MAX_IN_FLIGHT", 3))
+# how long a run is considered in flight at most, in seconds, so that
+# counters are eventually reset if a task is lost
+IN_FLIGHT_TIMEOUT = 60 * 5
+
+
+def get_code_execution_queue(exercise):
+    from courses.models import Exercise
+
+    return C_QUEUE if exercise.exercise_type == Exercise.C else JS_QUEUE
+
+
+def get_code_execution_priority(event):
+    from courses.models import Event
+
+    return HIGH_PRIORITY if event.event_type == Event.EXAM else NORMAL_PRIORITY
+
+
+# cache backends whose data isn't shared by the processes of the application
+PROCESS_LOCAL_CACHE_BACKENDS = [
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+]
+
+
+def is_slot_run_scheduling_enabled():
+    """
+    Returns True if runs of slots can be tracked with `schedule_slot_run`,
+    which requires a cache shared by the web processes and the workers running
+    the code; otherwise, runs aren't tracked, and they're never superseded or
+    limited
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    return backend not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+def get_in_flight_runs_key(user_id):
+    return f"code_runs_in_flight_{user_id}"
+
+
+def get_slot_run_token_key(slot_id):
+    return f"code_run_token_{slot_id}"
+
+
+def schedule_slot_run(slot_id, user_id):
+    """
+    Reserves a run of the code in the given slot for the user and returns a
+    token identifying it, or None if the user has too many runs in flight.
+
+    If a run of the slot is already queued, the new run supersedes it: the
+    older task will find out it's been superseded and skip running the code,
+    so the new run isn't counted towards the user's runs in flight
+    """
+    token_key = get_slot_run_token_key(slot_id)
+    if cache.get(token_key) is None:
+        in_flight_key = get_in_flight_runs_key(user_id)
+        if not cache.add(in_flight_key, 1, IN_FLIGHT_TIMEOUT):
+            if cache.incr(in_flight_key) > MAX_IN_FLIGHT_RUNS_PER_USER:
+                cache.decr(in_flight_key)
+                return None
+
+    token = uuid.uuid4().hex
+    cache.set(token_key, token, IN_FLIGHT_TIMEOUT)
+    return token
+
+
+def is_current_slot_run(slot_id, token):
+    """
+    Returns True if the run identified by `token` hasn't been superseded
+    by a newer run of the same slot. Runs without a token are never superseded,
+    and neither are runs whose token is missing from the cache, e.g. because it
+    expired: only the token of a newer run makes a run skip
+    """
+    if token is None:
+        return True
+    current_token = cache.get(get_slot_run_token_key(slot_id))
+    return current_token is None or current_token == token
+
+
+def complete_slot_run(slot_id, user_id, token):
+    """
+    Releases the reservation made for a run of the slot by `schedule_slot_run`,
+    unless a newer run of the slot has superseded it in the meantime
+    """
+    if token is None or not is_current_slot_run(slot_id, token):
+        return
+
+    cache.delete(get_slot_run_token_key(slot_id))
+    try:
+        cache.decr(get_in_flight_runs_key(user_id))
+    except ValueError:
+        # the counter expired
+        pass
@@ -1,9 +1,95 @@
+import random
+from collections import defaultdict
 from random import shuffle
-from courses.models import EventTemplate, Exercise
+from courses.models import EventTemplate, EventTemplateRule, Exercise
+
+
+class ExercisePoolIndex:
+    """
+    In-memory index of the base exercises of the course of an EventTemplate,
+    used to resolve all the rules of the template without querying the
+    database once per rule.
+
+    The index maps exercise states, tags, and the rules' exercise lists to sets
+    of candidate exercise id's, and is loaded with a constant number of queries
+    regardless of the number of rules in the template. An index can be reused
+    to draw exercises for several participations to the same event
+    """
+
+    def __init__(self, template: EventTemplate):
+        self.template = template
+
+        base_exercises = Exercise.objects.base_exercises().filter(
+            course_id=template.course_id
+        )
+        # map each exercise to its state
+        self.exercise_states = dict(base_exercises.values_list("pk", "state"))
+
+        # map each tag to the exercises that have it as a public/private tag
+        self.public_tag_exercises = self._get_tag_index(Exercise.public_tags.through)
+        self.private_tag_exercises = self._get_tag_index(
+            Exercise.private_tags.through
+        )
+
+        self.rules = list(
+            template.rules.all().prefetch_related("exercises", "clauses__tags")
+        )
+
+    def _get_tag_index(self, through_model):
+        ret = defaultdict(set)
+        for exercise_id, tag_id in through_model.objects.filter(
+            exercise_id__in=self.exercise_states.keys()
+        ).values_list("exercise_id", "tag_id"):
+            ret[tag_id].add(exercise_id)
+        return ret
+
+    def get_candidates(self, public_only=False):
+        """
+        Returns the id's of the exercises that can be picked by a rule
+        """
+        return {
+            pk
+            for pk, state in self.exercise_states.items()
+            if state != Exercise.DRAFT
+            and (not public_only or state == Exercise.PUBLIC)
+        }
+
+    def satisfying(self, rule: EventTemplateRule, candidates):
+        """
+        Returns the subset of `candidates` whose exercises satisfy the given rule.
+        Same as ExerciseQuerySet.satisfying, but computed in memory
+        """
+        if rule.rule_type is None:
+            return set()
+
+        if rule.rule_type == EventTemplateRule.ID_BASED:
+            return candidates & {e.pk for e in rule.exercises.all()}
+
+        if rule.rule_type == EventTemplateRule.TAG_BASED:
+            ret = set(candidates)
+            for clause in rule.clauses.all():
+                clause_tags = clause.tags.all()
+                if len(clause_tags) == 0:  # empty clause
+                    continue
+
+                clause_exercises = set()
+                for tag in clause_tags:
+                    clause_exercises |= self.public_tag_exercises[tag.pk]
+                    if not rule.search_public_tags_only:
+                        clause_exercises |= self.private_tag_exercises[tag.pk]
+
+                ret &= clause_exercises
+            return ret
+
+        # fully random rule
+        return set(candidates)
 
 
 def get_exercises_from(
-    template: EventTemplate, public_only=False, exclude_seen_in_practice=False
+    template: EventTemplate,
+    public_only=False,
+    exclude_seen_in_practice=False,
+    pool_index=None,
 ):
     """
     Returns a list of pair (exercise, rule) where rule is a rule of the given template
@@ -16,34 +102,40 @@ def get_exercises_from(
         exclude_seen_in_practice (bool, optional): whether exercises that
         the user has seen in at least one SELF_SERVICE_PRACTICE Event
         should be disqualified from being picked. Defaults to False.
+        pool_index (ExercisePoolIndex, optional): a previously loaded index for
+        the template, to be reused when drawing exercises multiple times. If
+        omitted, a new index is loaded.
 
     Returns:
         List[(Exercise, EventTemplateRule)]: a list of pairs representing the picked
         exercises and the rules they were picked according to
     """
-    course = template.event.course
-    exercises = Exercise.objects.base_exercises().filter(
-        course=course
-    )  # TODO prefetch?
+    if pool_index is None:
+        pool_index = ExercisePoolIndex(template)
 
-    if public_only:
-        exercises = exercises.public()
+    candidates = pool_index.get_candidates(public_only=public_only)
 
     if False and exclude_seen_in_practice:  # ! temporarily disable feature
-        exercises = exercises.not_seen_in_practice_by(template.event.creator)
+        candidates &= set(
+            Exercise.objects.not_seen_in_practice_by(
+                template.event.creator
+            ).values_list("pk", flat=True)
+        )
 
-    picked_exercises = []
-    rules = template.rules.all()
+    picked_ids = []  # list of pairs (exercise id, rule)
 
-    for rule in rules:
-        rule_qs = exercises.satisfying(rule)
+    for rule in pool_index.rules:
+        rule_candidates = pool_index.satisfying(rule, candidates)
+        # don't pick same exercise again
+        rule_candidates -= {pk for pk, _ in picked_ids}
 
-        rule_picked_exercises = rule_qs.exclude(
-            pk__in=[e.pk for e, _ in picked_exercises]  # don't pick same exercise again
-        ).get_random(amount=rule.amount)
+        # avoid trying to pick a larger sample than the list of id's
+        amount = min(rule.amount, len(rule_candidates))
+        for pk in random.sample(sorted(rule_candidates), amount):
+            picked_ids.append((pk, rule))
 
-        for picked_exercise in rule_picked_exercises:
-            picked_exercises.append((picked_exercise, rule))
+    exercises = Exercise.objects.in_bulk([pk for pk, _ in picked_ids])
+    picked_exercises = [(exercises[pk], rule) for pk, rule in picked_ids]
 
     if template.event.randomize_rule_order:
         shuffle(picked_exercises)
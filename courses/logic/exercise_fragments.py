@@ -0,0 +1,168 @@
+"""
+Serialized data of exercises, which is cached as exercises rarely change.
+
+`serialize_exercise` returns the same data as ExerciseSerializer without the
+work DRF does for each serialized object. Both the serializers and the plain
+functions in `courses.read_serializers` get the data of exercises from here.
+"""
+from django.core.cache import cache
+from rest_framework import serializers
+
+from courses.logic.presentation import (
+    EXERCISE_SHOW_HIDDEN_FIELDS,
+    EXERCISE_SHOW_SOLUTION_FIELDS,
+)
+from courses.models import ExerciseTestCase
+
+# field used to format scores the same way as the serializers' fields
+_score_field = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+def _format(field, value):
+    return None if value is None else field.to_representation(value)
+
+
+def serialize_user(user):
+    if user is None:
+        return None
+    return {
+        "id": user.pk,
+        "full_name": user.full_name,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "is_teacher": user.is_teacher,
+        "mat": user.mat,
+        "course": user.course,
+    }
+
+
+def serialize_tag(tag):
+    return {"id": tag.pk, "name": tag.name}
+
+
+def serialize_exercise_choice(choice, show_score_fields):
+    ret = {"id": choice.pk, "text": choice.text, "_ordering": choice._ordering}
+    if show_score_fields:
+        ret["correctness"] = _format(_score_field, choice.correctness)
+    return ret
+
+
+def serialize_exercise_testcase(testcase, show_hidden_fields):
+    if show_hidden_fields:
+        return {
+            "id": testcase.pk,
+            "code": testcase.code,
+            "text": testcase.text,
+            "_ordering": testcase._ordering,
+            "stdin": testcase.stdin,
+            "expected_stdout": testcase.expected_stdout,
+            "testcase_type": testcase.testcase_type,
+        }
+    # enforce the visibility rule of the test case
+    show_code = testcase.testcase_type == ExerciseTestCase.SHOW_CODE_SHOW_TEXT
+    show_text = show_code or testcase.testcase_type == ExerciseTestCase.SHOW_TEXT_ONLY
+    return {
+        "id": testcase.pk,
+        "_ordering": testcase._ordering,
+        "stdin": testcase.stdin,
+        "expected_stdout": testcase.expected_stdout,
+        "code": testcase.code if show_code else None,
+        "text": testcase.text if show_text else None,
+    }
+
+
+def serialize_exercise(exercise, context):
+    """
+    Returns the same data as ExerciseSerializer
+    """
+    show_hidden_fields = context.get(EXERCISE_SHOW_HIDDEN_FIELDS, False)
+    show_solution_fields = context.get(EXERCISE_SHOW_SOLUTION_FIELDS, False)
+
+    ret = {
+        "id": exercise.pk,
+        "text": exercise.text,
+        "exercise_type": exercise.exercise_type,
+    }
+    if show_hidden_fields:
+        ret["label"] = exercise.label
+    ret["public_tags"] = [serialize_tag(t) for t in exercise.public_tags.all()]
+    if show_hidden_fields:
+        ret["private_tags"] = [serialize_tag(t) for t in exercise.private_tags.all()]
+    ret["initial_code"] = exercise.initial_code
+    if show_hidden_fields:
+        ret["state"] = exercise.state
+    ret["requires_typescript"] = exercise.requires_typescript
+    if show_solution_fields:
+        ret["solution"] = exercise.solution
+    if show_hidden_fields:
+        ret["locked_by"] = serialize_user(exercise.locked_by)
+    ret["child_weight"] = exercise.child_weight
+    ret["max_score"] = exercise.get_max_score()
+    ret["sub_exercises"] = [
+        serialize_exercise(e, context) for e in exercise.sub_exercises.all()
+    ]
+    if context.get("show_choices", True):
+        show_score_fields = context.get(EXERCISE_SHOW_SOLUTION_FIELDS)
+        ret["choices"] = [
+            serialize_exercise_choice(c, show_score_fields)
+            for c in exercise.choices.all()
+        ]
+    if context.get("show_testcases", True):
+        ret["testcases"] = [
+            serialize_exercise_testcase(t, show_solution_fields)
+            for t in exercise.testcases.all()
+        ]
+    return ret
+
+
+# how long the serialized data of exercises is kept in cache, in seconds
+EXERCISE_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+
+def get_exercise_fragment_cache_key(exercise, context):
+    """
+    Returns the key for the serialized data of the exercise in the given context.
+    As the exercise is marked as modified whenever it or any of its related
+    objects change, outdated entries are never used again, and simply expire
+    """
+    flags = (
+        context.get(EXERCISE_SHOW_HIDDEN_FIELDS, False),
+        context.get(EXERCISE_SHOW_SOLUTION_FIELDS, False),
+        context.get("show_choices", True),
+        context.get("show_testcases", True),
+    )
+    return (
+        f"exercise_fragment_{exercise.pk}_{exercise.modified.timestamp()}_"
+        # locking an exercise doesn't update its modification timestamp
+        f"{exercise.locked_by_id}_{''.join(str(int(bool(f))) for f in flags)}"
+    )
+
+
+def get_exercise_fragments(exercises, context):
+    """
+    Returns a dict mapping the pk of the given exercises to the same data as
+    ExerciseSerializer, which is taken from the cache when possible
+    """
+    keys = {
+        exercise.pk: get_exercise_fragment_cache_key(exercise, context)
+        for exercise in exercises
+    }
+    cached = cache.get_many(keys.values())
+
+    ret = {}
+    missing = {}
+    for exercise in exercises:
+        key = keys[exercise.pk]
+        if key in cached:
+            ret[exercise.pk] = cached[key]
+        elif exercise.pk not in ret:
+            ret[exercise.pk] = missing[key] = serialize_exercise(exercise, context)
+
+    if len(missing) > 0:
+        cache.set_many(missing, EXERCISE_FRAGMENT_CACHE_TIMEOUT)
+    return ret
+
+
+def get_exercise_fragment(exercise, context):
+    return get_exercise_fragments([exercise], context)[exercise.pk]
@@ -1,7 +1,7 @@
 from datetime import timedelta
 from time import time
-from typing import Optional
-from courses.models import Event, EventParticipation
+from typing import Iterable, Optional
+from courses.models import Event, EventParticipation, EventParticipationSlot
 from users.models import User
 from django.utils import timezone
 
@@ -64,3 +64,27 @@ def is_time_up(
     return now > (
         participation.begin_timestamp + timedelta(seconds=time_limit + grace_period)
     )
+
+
+def share_participation_with_sub_slots(
+    participation: EventParticipation, slots: Iterable[EventParticipationSlot]
+) -> None:
+    """Sets the given participation as the cached participation of the
+    prefetched sub-slots of the given slots, recursively.
+
+    Prefetching the sub-slots of a slot doesn't populate their participation,
+    so accessing it (e.g. to get its event) would otherwise cause one query
+    for each sub-slot.
+
+    Args:
+        participation (EventParticipation): the participation the slots belong to
+        slots (Iterable[EventParticipationSlot]): the slots whose sub-slots to
+        update
+    """
+    for slot in slots:
+        if "sub_slots" not in getattr(slot, "_prefetched_objects_cache", {}):
+            continue
+        sub_slots = slot.sub_slots.all()
+        for sub_slot in sub_slots:
+            sub_slot.participation = participation
+        share_participation_with_sub_slots(participation, sub_slots)
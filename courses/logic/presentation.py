@@ -21,3 +21,8 @@ EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS = (
 EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS = (
     "EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS"
 )
+# context key holding a dict where slots collect their exercises by id, when
+# exercises are serialized separately from the slots that reference them
+EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES = (
+    "EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES"
+)
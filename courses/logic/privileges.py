@@ -1,4 +1,10 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import transaction
 
 # VIEW_ENROLLED = "view_enrolled"
 UPDATE_COURSE = "update_course"
@@ -33,55 +39,144 @@ def validate_permission_list(lst):
             raise ValidationError(f"{item} not in teacher privileges")
 
 
-def get_user_privileges(user, course):
-    from courses.models import Course, UserCoursePrivilege
+# how long privileges are kept in the shared cache, in seconds
+PRIVILEGES_CACHE_TIMEOUT = 60 * 60
 
-    if user.is_anonymous:
-        return []
 
-    if not isinstance(course, Course):
-        course = Course.objects.get(pk=course)
+def get_privileges_version_key(course_pk):
+    return f"course_privileges_version_{course_pk}"
 
-    if user == course.creator:
-        return TEACHER_PRIVILEGES
 
-    # if data has been prefetched, use the optimized data
-    if hasattr(user, "prefetched_course_roles"):
-        user_roles = [
-            r for r in user.prefetched_course_roles if r.course.pk == course.pk
-        ]
-    elif hasattr(course, "prefetched_user_roles"):
-        user_roles = [r for r in course.prefetched_user_roles if r.user.pk == user.pk]
-    else:
-        user_roles = user.roles.filter(course=course)
+def get_privileges_version(course_pk):
+    version_key = get_privileges_version_key(course_pk)
+    version = cache.get(version_key)
+    if version is None:
+        # start from a fresh value rather than a constant one, so that entries
+        # cached before the version key got evicted can't be used again
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    return version
 
-    allow_privileges = [
-        privilege
-        for role_privileges in (role.allow_privileges for role in user_roles)
-        for privilege in role_privileges
-    ]
 
+def bump_privileges_version(course_pk):
+    """
+    Invalidates the privileges cached for the given course. Needs to be called
+    whenever something the privileges of users for the course depend on changes
+    """
+    version_key = get_privileges_version_key(course_pk)
+    cache.set(version_key, time.time_ns(), None)
+    # until the changes are committed, other processes still compute and cache
+    # privileges from the old data, so they're invalidated again on commit
+    transaction.on_commit(lambda: cache.set(version_key, time.time_ns(), None))
+
+
+# memoized privileges of users, shared by all the code executed in the scope
+# of a request or of a message received by a consumer. None outside of such a scope
+_privileges_cache = ContextVar("privileges_cache", default=None)
+
+
+@contextmanager
+def privileges_cache():
+    """
+    Memoizes the privileges resolved inside of the block, so that the privileges
+    of a user for a course are only computed once per request or consumer message
+    """
+    token = _privileges_cache.set({})
     try:
+        yield
+    finally:
+        _privileges_cache.reset(token)
+
+
+def get_privilege_lists(user, course):
+    """
+    Returns a tuple (allow_privileges, deny_privileges, is_creator) describing
+    the privileges of `user` for `course`, which can either be a Course
+    object or the id of a course. The result is memoized if called inside
+    of a `privileges_cache` block, and shared across requests using the
+    cache framework
+    """
+    from courses.models import Course, UserCoursePrivilege
+
+    course_pk = course.pk if isinstance(course, Course) else course
+    request_cache = _privileges_cache.get()
+    request_cache_key = (user.pk, str(course_pk))
+    if request_cache is not None and request_cache_key in request_cache:
+        return request_cache[request_cache_key]
+
+    cache_key = (
+        f"course_privileges_{user.pk}_{course_pk}_{get_privileges_version(course_pk)}"
+    )
+    ret = cache.get(cache_key)
+    if ret is not None:
+        if request_cache is not None:
+            request_cache[request_cache_key] = ret
+        return ret
+
+    if not isinstance(course, Course):
+        course = Course.objects.get(pk=course)
+
+    if user.pk == course.creator_id:
+        ret = (TEACHER_PRIVILEGES, [], True)
+    else:
         # if data has been prefetched, use the optimized data
-        if hasattr(user, "prefetched_privileged_courses"):
-            per_user_privileges = [
-                c
-                for c in user.prefetched_privileged_courses
-                if c.course.pk == course.pk
-            ][0]
-        elif hasattr(course, "prefetched_privileged_users"):
-            per_user_privileges = [
-                u for u in course.prefetched_privileged_users if u.user.pk == user.pk
-            ][0]
+        if hasattr(user, "prefetched_course_roles"):
+            user_roles = [
+                r for r in user.prefetched_course_roles if r.course.pk == course.pk
+            ]
+        elif hasattr(course, "prefetched_user_roles"):
+            user_roles = [
+                r for r in course.prefetched_user_roles if r.user.pk == user.pk
+            ]
         else:
-            per_user_privileges = UserCoursePrivilege.objects.get(
-                user=user, course=course
-            )
+            user_roles = user.roles.filter(course=course)
+
+        allow_privileges = [
+            privilege
+            for role_privileges in (role.allow_privileges for role in user_roles)
+            for privilege in role_privileges
+        ]  # get all the privileges for this user's roles
+
+        try:
+            # if data has been prefetched, use the optimized data
+            if hasattr(user, "prefetched_privileged_courses"):
+                per_user_privileges = [
+                    c
+                    for c in user.prefetched_privileged_courses
+                    if c.course.pk == course.pk
+                ][0]
+            elif hasattr(course, "prefetched_privileged_users"):
+                per_user_privileges = [
+                    u
+                    for u in course.prefetched_privileged_users
+                    if u.user.pk == user.pk
+                ][0]
+            else:
+                per_user_privileges = UserCoursePrivilege.objects.get(
+                    user=user, course=course
+                )
+
+            # add per-user privileges
+            allow_privileges.extend(per_user_privileges.allow_privileges)
+            deny_privileges = per_user_privileges.deny_privileges
+        except (UserCoursePrivilege.DoesNotExist, IndexError):
+            deny_privileges = []
+
+        ret = (allow_privileges, deny_privileges, False)
+
+    cache.set(cache_key, ret, PRIVILEGES_CACHE_TIMEOUT)
+    if request_cache is not None:
+        request_cache[request_cache_key] = ret
+    return ret
+
+
+def get_user_privileges(user, course):
+    if user.is_anonymous:
+        return []
 
-        allow_privileges.extend(per_user_privileges.allow_privileges)  # add per-user
-        deny_privileges = per_user_privileges.deny_privileges
-    except (UserCoursePrivilege.DoesNotExist, IndexError):
-        deny_privileges = []
+    allow_privileges, deny_privileges, is_creator = get_privilege_lists(user, course)
+    if is_creator:
+        return TEACHER_PRIVILEGES
 
     return [
         privilege for privilege in allow_privileges if privilege not in deny_privileges
@@ -94,32 +189,13 @@ def check_privilege(user, course, privilege):
     Returns True if and only `user` has `privilege` for `course`
     `course` can either be a Course object or the id of a course
     """
-    from courses.models import Course, UserCoursePrivilege
-
     if user.is_anonymous:
         return False
 
-    if not isinstance(course, Course):
-        course = Course.objects.get(pk=course)
-
-    if user == course.creator:
+    allow_privileges, deny_privileges, is_creator = get_privilege_lists(user, course)
+    if is_creator:
         return True
 
-    allow_privileges = [
-        privilege
-        for role_privileges in (
-            role.allow_privileges for role in user.roles.filter(course=course)
-        )
-        for privilege in role_privileges
-    ]  # get all the privileges for this user's roles
-
-    try:
-        per_user_privileges = UserCoursePrivilege.objects.get(user=user, course=course)
-        allow_privileges.extend(per_user_privileges.allow_privileges)  # add per-user
-        deny_privileges = per_user_privileges.deny_privileges
-    except UserCoursePrivilege.DoesNotExist:
-        deny_privileges = []
-
     if privilege == "__some__":
         return len(allow_privileges) > 0
 
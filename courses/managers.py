@@ -1,6 +1,9 @@
+import random
+from collections import defaultdict
+
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, F, Q
 
 from courses.querysets import (
     CourseQuerySet,
@@ -126,9 +129,18 @@ class ExerciseManager(models.Manager):
 
 
 class EventParticipationManager(models.Manager):
+    # how many unassigned participations a user tries to claim before giving up
+    POOL_CLAIM_CANDIDATES = 20
+
     def get_queryset(self):
         return EventParticipationQuerySet(self.model, using=self._db)
 
+    def assigned(self):
+        return self.get_queryset().assigned()
+
+    def unassigned(self):
+        return self.get_queryset().unassigned()
+
     def create(self, *args, **kwargs):
         """
         Creates an event participation and its related slots
@@ -140,9 +152,12 @@ class EventParticipationManager(models.Manager):
             kwargs["event_id"] is not None
         )  # TODO eventually remove this when you make event field non-nullable
 
+        exercises_with_rules = kwargs.pop("exercises", None)
+        pool_index = kwargs.pop("pool_index", None)
+
         participation = super().create(*args, **kwargs)
 
-        if (exercises := kwargs.pop("exercises", None)) is None:
+        if exercises_with_rules is None:
             event = Event.objects.get(pk=kwargs["event_id"])
             event_template = event.template
 
@@ -153,25 +168,64 @@ class EventParticipationManager(models.Manager):
                 exclude_seen_in_practice=(
                     event.event_type == Event.SELF_SERVICE_PRACTICE
                 ),
+                pool_index=pool_index,
             )
 
-        slot_number = 0
-        for exercise, populating_rule in exercises_with_rules:
-            now = timezone.localtime(timezone.now())
-            # mark first slot as seen
-            seen_at_kwarg = {"seen_at": now} if slot_number == 0 else {}
-
-            EventParticipationSlot.objects.create(
-                participation=participation,
-                exercise=exercise,
-                populating_rule=populating_rule,
-                slot_number=slot_number,
-                **seen_at_kwarg,
-            )
-            slot_number += 1
+        EventParticipationSlot.objects.create_slot_tree(
+            participation, exercises_with_rules
+        )
 
         return participation
 
+    def create_pool(self, event, amount):
+        """
+        Generates `amount` participations to `event` that aren't assigned to any
+        user yet, so they can later be claimed by users when they participate
+        """
+        from .logic.event_instances import ExercisePoolIndex
+
+        # the exercise pool of the event is loaded once and shared by all the
+        # participations in the pool
+        pool_index = ExercisePoolIndex(event.template)
+        return [
+            self.create(user=None, event_id=event.pk, pool_index=pool_index)
+            for _ in range(amount)
+        ]
+
+    def claim(self, event_id, user):
+        """
+        Atomically assigns one of the pre-generated participations of the given
+        event to `user`.
+
+        Returns the pk of the claimed participation, or None if the event has
+        no unassigned participations left
+        """
+        from .models import EventParticipationSlot
+
+        candidates = list(
+            self.unassigned()
+            .filter(event_id=event_id)
+            .values_list("pk", flat=True)[: self.POOL_CLAIM_CANDIDATES]
+        )
+        # spread concurrent requests over different rows to reduce contention
+        random.shuffle(candidates)
+
+        for pk in candidates:
+            now = timezone.localtime(timezone.now())
+            # the update only succeeds if no one else has claimed the participation
+            if (
+                self.get_queryset()
+                .filter(pk=pk, user__isnull=True)
+                .update(user=user, begin_timestamp=now)
+            ):
+                # mark first slot as seen
+                EventParticipationSlot.objects.base_slots().filter(
+                    participation_id=pk, slot_number=0
+                ).update(seen_at=now)
+                return pk
+
+        return None
+
 
 class EventParticipationSlotManager(models.Manager):
     def get_queryset(self):
@@ -198,6 +252,61 @@ class EventParticipationSlotManager(models.Manager):
 
         return slot
 
+    def create_slot_tree(self, participation, exercises_with_rules):
+        """
+        Creates the base slots of `participation` for the given list of pairs
+        (exercise, rule), together with the sub-slots that reference their
+        sub-exercises.
+
+        The whole tree of slots is built in memory and written one level of depth
+        at a time, so the number of queries only depends on how deeply exercises
+        are nested, not on how many exercises the participation contains
+        """
+        from .models import EventParticipationSlot, Exercise
+
+        now = timezone.localtime(timezone.now())
+        slots = [
+            EventParticipationSlot(
+                participation=participation,
+                exercise=exercise,
+                populating_rule=populating_rule,
+                slot_number=slot_number,
+                # mark first slot as seen
+                seen_at=now if slot_number == 0 else None,
+            )
+            for slot_number, (exercise, populating_rule) in enumerate(
+                exercises_with_rules
+            )
+        ]
+
+        created_slots = []
+        while len(slots) > 0:
+            slots = self.bulk_create(slots)
+            created_slots.extend(slots)
+
+            # get the sub-exercises of all the exercises in the current level
+            sub_exercises = defaultdict(list)
+            for sub_exercise in Exercise.objects.filter(
+                parent_id__in={s.exercise_id for s in slots}
+            ):
+                sub_exercises[sub_exercise.parent_id].append(sub_exercise)
+
+            # build the next level of slots, which reference the sub-exercises
+            slots = [
+                EventParticipationSlot(
+                    parent=slot,
+                    participation=participation,
+                    exercise=sub_exercise,
+                    slot_number=sub_slot_number,
+                )
+                for slot in slots
+                for sub_slot_number, sub_exercise in enumerate(
+                    sub_exercises[slot.exercise_id]
+                )
+            ]
+
+        return created_slots
+
 
 class EventManager(models.Manager):
     def create(self, *args, **kwargs):
@@ -211,6 +320,46 @@ class EventManager(models.Manager):
 
         return event
 
+    def update_states(self):
+        """
+        Persists the state transitions of events that depend on time or on the
+        users allowed past the closure of RESTRICTED events, using conditional
+        updates so that concurrent changes to the events aren't overwritten
+        """
+        from .models import Event
+
+        now = timezone.localtime(timezone.now())
+
+        self.filter(
+            _event_state=Event.PLANNED,
+            open_automatically=True,
+            begin_timestamp__lte=now,
+        ).update(_event_state=Event.OPEN)
+        self.filter(
+            _event_state=Event.OPEN,
+            close_automatically=True,
+            end_timestamp__lte=now,
+        ).update(_event_state=Event.CLOSED)
+
+        restricted = self.filter(_event_state=Event.RESTRICTED).annotate(
+            allowed_count=Count("users_allowed_past_closure", distinct=True),
+            participation_count=Count(
+                "participations",
+                filter=Q(participations__user__isnull=False),
+                distinct=True,
+            ),
+        )
+        self.filter(
+            _event_state=Event.RESTRICTED,
+            pk__in=restricted.filter(allowed_count=0).values("pk"),
+        ).update(_event_state=Event.CLOSED)
+        self.filter(
+            _event_state=Event.RESTRICTED,
+            pk__in=restricted.filter(
+                allowed_count__gt=0, allowed_count=F("participation_count")
+            ).values("pk"),
+        ).update(_event_state=Event.OPEN)
+
 
 class EventTemplateRuleManager(models.Manager):
     def create(self, *args, **kwargs):
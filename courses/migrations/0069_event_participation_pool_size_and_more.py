@@ -0,0 +1,26 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0068_rename_max_score_eventtemplaterule_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='participation_pool_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='eventparticipation',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='participations', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
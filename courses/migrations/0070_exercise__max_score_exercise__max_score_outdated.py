@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0069_event_participation_pool_size_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='_max_score',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='_max_score_outdated',
+            field=models.BooleanField(default=True),
+        ),
+    ]
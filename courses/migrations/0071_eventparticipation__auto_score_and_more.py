@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0070_exercise__max_score_exercise__max_score_outdated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventparticipation',
+            name='_auto_score',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventparticipation',
+            name='_auto_score_outdated',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='eventparticipationslot',
+            name='_auto_score',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventparticipationslot',
+            name='_auto_score_outdated',
+            field=models.BooleanField(default=True),
+        ),
+    ]
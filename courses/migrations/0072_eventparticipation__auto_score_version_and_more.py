@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-17 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0071_eventparticipation__auto_score_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventparticipation',
+            name='_auto_score_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eventparticipationslot',
+            name='_auto_score_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
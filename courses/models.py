@@ -16,6 +16,7 @@ from .abstract_models import (
     SideSlotNumberedModel,
     SlotNumberedModel,
     TimestampableModel,
+    TrackFieldsMixin,
 )
 from .managers import (
     CourseManager,
@@ -53,6 +54,11 @@ class Course(TimestampableModel):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # privileges depend on the creator of the course
+        privileges.bump_privileges_version(self.pk)
+
 
 class UserCoursePrivilege(models.Model):
     user = models.ForeignKey(
@@ -78,7 +84,14 @@ class UserCoursePrivilege(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        return super().save(*args, **kwargs)
+        ret = super().save(*args, **kwargs)
+        privileges.bump_privileges_version(self.course_id)
+        return ret
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        privileges.bump_privileges_version(self.course_id)
+        return ret
 
     def clean(self, *args, **kwargs):
         privileges.validate_permission_list(self.allow_privileges)
@@ -116,7 +129,14 @@ class CourseRole(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        return super().save(*args, **kwargs)
+        ret = super().save(*args, **kwargs)
+        privileges.bump_privileges_version(self.course_id)
+        return ret
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        privileges.bump_privileges_version(self.course_id)
+        return ret
 
     def clean(self, *args, **kwargs):
         privileges.validate_permission_list(self.allow_privileges)
@@ -234,10 +254,19 @@ class Exercise(TimestampableModel, OrderableModel, LockableModel):
     time_to_complete = models.PositiveIntegerField(null=True, blank=True)
     skip_if_timeout = models.BooleanField(default=False)
     requires_typescript = models.BooleanField(default=False)
+    # denormalized maximum score of the exercise, kept up to date when
+    # the entities it depends on change - use `get_max_score` to access it
+    _max_score = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+    _max_score_outdated = models.BooleanField(default=True)
 
     objects = ExerciseManager()
 
     ORDER_WITH_RESPECT_TO_FIELD = "parent"
+    # fields that the max score of the exercise or its parent depends on
+    MAX_SCORE_FIELDS = ["child_weight", "exercise_type", "parent_id"]
+    TRACKED_FIELDS = OrderableModel.TRACKED_FIELDS + MAX_SCORE_FIELDS
 
     class Meta:
         ordering = [
@@ -262,7 +291,48 @@ class Exercise(TimestampableModel, OrderableModel, LockableModel):
     def clean(self):
         pass
 
+    def save(self, *args, **kwargs):
+        creating = self.pk is None
+        changed_fields = [
+            f
+            for f in self.MAX_SCORE_FIELDS
+            if getattr(self, f"_old_{f}", getattr(self, f)) != getattr(self, f)
+        ]
+        super().save(*args, **kwargs)
+
+        if creating or len(changed_fields) > 0:
+            self.update_max_score()
+            self.mark_slot_scores_outdated()
+
+        if self.parent_id is not None:
+            self.parent.mark_modified()
+
+        if "parent_id" in changed_fields and self._old_parent_id is not None:
+            # the exercise has been detached from its former parent
+            old_parent = Exercise.objects.get(pk=self._old_parent_id)
+            old_parent.update_max_score()
+            old_parent.mark_slot_scores_outdated()
+            old_parent.mark_modified()
+
+        for fieldname in self.MAX_SCORE_FIELDS:
+            setattr(self, f"_old_{fieldname}", getattr(self, fieldname))
+
+    def delete(self, *args, **kwargs):
+        parent_id = self.parent_id
+        ret = super().delete(*args, **kwargs)
+        if parent_id is not None:
+            parent = Exercise.objects.get(pk=parent_id)
+            parent.update_max_score()
+            parent.mark_slot_scores_outdated()
+            parent.mark_modified()
+        return ret
+
     def get_max_score(self):
+        if self._max_score_outdated:
+            self.update_max_score(propagate=False)
+        return self._max_score
+
+    def compute_max_score(self):
         if self.exercise_type in [Exercise.OPEN_ANSWER, Exercise.ATTACHMENT]:
             return None
         if self.exercise_type in [Exercise.AGGREGATED, Exercise.COMPLETION]:
@@ -285,6 +355,51 @@ class Exercise(TimestampableModel, OrderableModel, LockableModel):
 
         assert False, f"max_score not defined for type {self.exercise_type}"
 
+    def update_max_score(self, propagate=True):
+        """
+        Recomputes and stores the max score of the exercise. If `propagate` is
+        True, the max score of the ancestors of the exercise is updated as well
+        """
+        max_score = self.compute_max_score()
+        self._max_score = Decimal(max_score) if max_score is not None else None
+        self._max_score_outdated = False
+        Exercise.objects.filter(pk=self.pk).update(
+            _max_score=self._max_score, _max_score_outdated=False
+        )
+
+        if propagate and self.parent_id is not None:
+            self.parent.update_max_score()
+
+    def mark_slot_scores_outdated(self):
+        """
+        Marks as outdated the scores of the slots containing the exercise, or
+        any of its ancestors, which depend on the exercise's choices and test cases
+        """
+        exercise_ids = [self.pk]
+        curr = self
+        while curr.parent_id is not None:
+            curr = curr.parent
+            exercise_ids.append(curr.pk)
+
+        EventParticipationSlot.objects.filter(
+            exercise_id__in=exercise_ids
+        ).mark_scores_outdated()
+
+    def mark_modified(self):
+        """
+        Updates the modification timestamp of the exercise and of its ancestors,
+        whose serialized data includes the exercise. Needs to be called when
+        the related objects of the exercise, e.g. its choices, change
+        """
+        exercise_ids = [self.pk]
+        curr = self
+        while curr.parent_id is not None:
+            curr = curr.parent
+            exercise_ids.append(curr.pk)
+
+        self.modified = timezone.now()
+        Exercise.objects.filter(pk__in=exercise_ids).update(modified=self.modified)
+
 
 class ExerciseChoice(OrderableModel):
     exercise = models.ForeignKey(
@@ -300,6 +415,7 @@ class ExerciseChoice(OrderableModel):
     )
 
     ORDER_WITH_RESPECT_TO_FIELD = "exercise"
+    TRACKED_FIELDS = OrderableModel.TRACKED_FIELDS + ["correctness"]
 
     class Meta:
         ordering = ["exercise_id", "_ordering"]
@@ -321,6 +437,22 @@ class ExerciseChoice(OrderableModel):
             + ")"
         )
 
+    def save(self, *args, **kwargs):
+        creating = self.pk is None
+        super().save(*args, **kwargs)
+        if creating or getattr(self, "_old_correctness", None) != self.correctness:
+            self.exercise.update_max_score()
+            self.exercise.mark_slot_scores_outdated()
+        self._old_correctness = self.correctness
+        self.exercise.mark_modified()
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        self.exercise.update_max_score()
+        self.exercise.mark_slot_scores_outdated()
+        self.exercise.mark_modified()
+        return ret
+
     # def save(self, *args, **kwargs):
     #     # TODO resolve conflict with _ordering field, which is non-nullable
     #     # self.full_clean()
@@ -374,8 +506,23 @@ class ExerciseTestCase(OrderableModel):
     def __str__(self):
         return str(self.exercise) + " - " + self.code
 
+    def save(self, *args, **kwargs):
+        creating = self.pk is None
+        super().save(*args, **kwargs)
+        if creating:
+            self.exercise.update_max_score()
+            self.exercise.mark_slot_scores_outdated()
+        self.exercise.mark_modified()
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        self.exercise.update_max_score()
+        self.exercise.mark_slot_scores_outdated()
+        self.exercise.mark_modified()
+        return ret
+
 
-class Event(HashIdModel, TimestampableModel, LockableModel):
+class Event(HashIdModel, TimestampableModel, LockableModel, TrackFieldsMixin):
     SELF_SERVICE_PRACTICE = 0
     IN_CLASS_PRACTICE = 1
     EXAM = 2
@@ -416,6 +563,14 @@ class Event(HashIdModel, TimestampableModel, LockableModel):
         (TIME_LIMIT, "Time limit"),
     )
 
+    # event types for which participations can be generated in advance
+    POOLED_EVENT_TYPES = (EXAM, IN_CLASS_PRACTICE)
+
+    # fields that determine the participations generated in advance for the event
+    PARTICIPATION_POOL_FIELDS = ["event_type", "participation_pool_size"]
+
+    TRACKED_FIELDS = ["_event_state"] + PARTICIPATION_POOL_FIELDS
+
     course = models.ForeignKey(
         Course,
         on_delete=models.PROTECT,
@@ -459,6 +614,8 @@ class Event(HashIdModel, TimestampableModel, LockableModel):
     time_limit_seconds = models.PositiveIntegerField(null=True, blank=True)
     time_limit_exceptions = models.JSONField(default=list, blank=True)
     randomize_rule_order = models.BooleanField(default=False)
+    # number of unassigned participations to generate when the event is planned
+    participation_pool_size = models.PositiveIntegerField(default=0)
 
     objects = EventManager()
 
@@ -500,44 +657,37 @@ class Event(HashIdModel, TimestampableModel, LockableModel):
         rules = self.template.rules.all()
         per_rule_value = value / sum([r.amount for r in rules])
         rules.update(weight=per_rule_value)
+        EventParticipationSlot.objects.filter(
+            populating_rule__in=rules
+        ).mark_scores_outdated()
 
     @property
     def state(self):
+        """
+        Computes the current state of the event from its stored state and its
+        timestamps, without writing to or querying the db. Time-based transitions
+        are persisted periodically by the `update_event_states` task
+        """
         now = timezone.localtime(timezone.now())
+        state = self._event_state
 
         if (
-            self._event_state == Event.PLANNED
+            state == Event.PLANNED
             and self.open_automatically
             and self.begin_timestamp is not None
             and now >= self.begin_timestamp
         ):
-            self._event_state = Event.OPEN
-            self.save()
+            state = Event.OPEN
 
         if (
-            self._event_state == Event.OPEN
+            state == Event.OPEN
             and self.close_automatically
             and self.end_timestamp is not None
             and now >= self.end_timestamp
         ):
-            self._event_state = Event.CLOSED
-            self.save()
+            state = Event.CLOSED
 
-        if (
-            self._event_state == Event.RESTRICTED
-            and not self.users_allowed_past_closure.exists()
-        ):
-            self._event_state = Event.CLOSED
-            self.save()
-
-        if (
-            self._event_state == Event.RESTRICTED
-            and self.users_allowed_past_closure.count() == self.participations.count()
-        ):
-            self._event_state = Event.OPEN
-            self.save()
-
-        return self._event_state
+        return state
 
     @state.setter
     def state(self, value):
@@ -545,7 +695,82 @@ class Event(HashIdModel, TimestampableModel, LockableModel):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        return super().save(*args, **kwargs)
+        ret = super().save(*args, **kwargs)
+
+        old_state = getattr(self, "_old__event_state", None)
+        pool_fields_changed = any(
+            getattr(self, f"_old_{f}", getattr(self, f)) != getattr(self, f)
+            for f in self.PARTICIPATION_POOL_FIELDS
+        )
+        state_changed = old_state != self._event_state
+        if state_changed:
+            self.on_state_change(old_state)
+        if pool_fields_changed and not (
+            state_changed and self._event_state == Event.PLANNED
+        ):
+            # when the event is planned, its pool is generated by `on_state_change`
+            self.refresh_participation_pool()
+
+        for fieldname in self.TRACKED_FIELDS:
+            setattr(self, f"_old_{fieldname}", getattr(self, fieldname))
+
+        return ret
+
+    def update_restricted_state(self):
+        """
+        Closes a RESTRICTED event if no users are allowed past its closure anymore,
+        or re-opens it if all of its participants are
+        """
+        if self._event_state != Event.RESTRICTED:
+            return
+
+        allowed_count = self.users_allowed_past_closure.count()
+        if allowed_count == 0:
+            new_state = Event.CLOSED
+        elif allowed_count == self.participations.assigned().count():
+            new_state = Event.OPEN
+        else:
+            return
+
+        # only update the event if no one else has changed its state in the meantime
+        if Event.objects.filter(pk=self.pk, _event_state=Event.RESTRICTED).update(
+            _event_state=new_state
+        ):
+            self._event_state = self._old__event_state = new_state
+
+    def refresh_participation_pool(self):
+        """
+        Discards the participations generated in advance that haven't been
+        assigned to any user yet, as they might not reflect the event and its
+        template anymore, and generates them again if the event has a pool
+        """
+        from courses.tasks import create_participation_pool_task
+
+        with transaction.atomic():
+            # wait for a concurrent generation of the pool to be over, so that
+            # the participations it generates are discarded too
+            list(Event.objects.select_for_update().filter(pk=self.pk))
+            self.participations.unassigned().delete()
+
+        if (
+            self.state in (Event.PLANNED, Event.OPEN)
+            and self.event_type in Event.POOLED_EVENT_TYPES
+            and self.participation_pool_size > 0
+        ):
+            # pre-generate the participations that users will claim once the event opens
+            event_id = str(self.pk)
+            transaction.on_commit(lambda: create_participation_pool_task.delay(event_id))
+
+    def on_state_change(self, old_state):
+        if self._event_state == Event.PLANNED:
+            self.refresh_participation_pool()
+        elif self._event_state == Event.RESTRICTED:
+            # don't wait for the periodic update if the event is already resolved
+            self.update_restricted_state()
+        elif old_state == Event.PLANNED and self._event_state == Event.DRAFT:
+            # the event is being edited again: discard the participations generated
+            # so far, as they might not reflect the final template
+            self.participations.unassigned().delete()
 
     def clean(self, *args, **kwargs):
         if not isinstance(self.time_limit_exceptions, list):
@@ -646,6 +871,7 @@ class EventTemplateRule(OrderableModel):
     objects = EventTemplateRuleManager()
 
     ORDER_WITH_RESPECT_TO_FIELD = "template"
+    TRACKED_FIELDS = OrderableModel.TRACKED_FIELDS + ["weight"]
 
     class Meta:
         ordering = ["template_id", "_ordering"]
@@ -657,6 +883,13 @@ class EventTemplateRule(OrderableModel):
             )
         ]
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if getattr(self, "_old_weight", self.weight) != self.weight:
+            # the score of the slots populated by this rule depends on its weight
+            self.populated_slots.all().mark_scores_outdated()
+        self._old_weight = self.weight
+
 
 class EventTemplateRuleClause(models.Model):
     rule = models.ForeignKey(
@@ -698,8 +931,10 @@ class EventParticipation(models.Model):
     )
 
     # relations
-    user = models.ForeignKey(
+    user = models.ForeignKey(  # null for pre-generated participations not yet claimed
         User,
+        null=True,
+        blank=True,
         related_name="participations",
         on_delete=models.PROTECT,
     )
@@ -726,6 +961,18 @@ class EventParticipation(models.Model):
         default=DRAFT,
     )
     _score = models.TextField(blank=True, null=True)
+    # sum of the scores of the slots, stored to avoid computing it on each
+    # access - it's recomputed when accessed after being marked as outdated
+    _auto_score = models.DecimalField(
+        max_digits=7,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    _auto_score_outdated = models.BooleanField(default=True)
+    # incremented each time the score is marked as outdated, so that a score
+    # computed before that isn't stored as up to date
+    _auto_score_version = models.PositiveIntegerField(default=0)
 
     objects = EventParticipationManager()
 
@@ -790,19 +1037,34 @@ class EventParticipation(models.Model):
     @property
     def score(self):
         if self._score is None:
-            return str(
-                round(
-                    sum(
-                        [
-                            s.score if s.score is not None else 0
-                            for s in self.prefetched_base_slots
-                        ]
-                    ),
-                    2,
-                ),
-            )
+            return str(self.auto_score)
         return self._score
 
+    @property
+    def auto_score(self):
+        if self._auto_score_outdated:
+            self.update_auto_score()
+        return self._auto_score
+
+    def update_auto_score(self):
+        """
+        Recomputes and stores the sum of the scores of the base slots
+        """
+        base_slots = (
+            self.prefetched_base_slots
+            if hasattr(self, "prefetched_base_slots")
+            else self.slots.base_slots()
+        )
+        self._auto_score = round(
+            Decimal(sum([s.score if s.score is not None else 0 for s in base_slots])),
+            2,
+        )
+        self._auto_score_outdated = False
+        # the score isn't stored if it's been marked as outdated in the meantime
+        EventParticipation.objects.filter(
+            pk=self.pk, _auto_score_version=self._auto_score_version
+        ).update(_auto_score=self._auto_score, _auto_score_outdated=False)
+
     @score.setter
     def score(self, value):
         self._score = value
@@ -953,9 +1215,24 @@ class EventParticipationSlot(models.Model):
         null=True,
         blank=True,
     )
+    # score computed by the assessor, stored to avoid re-assessing the slot on
+    # each access - it's recomputed when accessed after being marked as outdated
+    _auto_score = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+    _auto_score_outdated = models.BooleanField(default=True)
+    # incremented each time the score is marked as outdated, so that a score
+    # computed before that isn't stored as up to date
+    _auto_score_version = models.PositiveIntegerField(default=0)
 
     objects = EventParticipationSlotManager()
 
+    # fields whose update doesn't affect the score of the slot
+    BOOKKEEPING_FIELDS = ["seen_at", "answered_at"]
+
     class Meta:
         ordering = ["participation_id", "parent_id", "slot_number"]
         constraints = [
@@ -980,6 +1257,8 @@ class EventParticipationSlot(models.Model):
             Exercise.MULTIPLE_CHOICE_MULTIPLE_POSSIBLE,
             Exercise.MULTIPLE_CHOICE_SINGLE_POSSIBLE,
         ]:
+            if "selected_choices" in getattr(self, "_prefetched_objects_cache", {}):
+                return len(self.selected_choices.all()) > 0
             return self.selected_choices.exists()
 
         if e_type in [Exercise.OPEN_ANSWER, Exercise.JS, Exercise.C]:
@@ -996,9 +1275,42 @@ class EventParticipationSlot(models.Model):
     @property
     def score(self):
         if self._score is None:
-            return get_assessor_class(self.participation.event)(self).assess()
+            return self.auto_score
         return self._score
 
+    @property
+    def auto_score(self):
+        if self._auto_score_outdated:
+            self.update_auto_score()
+        return self._auto_score
+
+    def update_auto_score(self):
+        """
+        Assesses the slot and stores the resulting score
+        """
+        score = get_assessor_class(self.participation.event)(self).assess()
+        self._auto_score = round(Decimal(score), 2) if score is not None else None
+        self._auto_score_outdated = False
+        # the score isn't stored if it's been marked as outdated in the meantime
+        EventParticipationSlot.objects.filter(
+            pk=self.pk, _auto_score_version=self._auto_score_version
+        ).update(_auto_score=self._auto_score, _auto_score_outdated=False)
+
+    def mark_score_outdated(self):
+        """
+        Marks the score of the slot, of its ancestors, and of its participation
+        as outdated, so they are recomputed the next time they are accessed
+        """
+        slot_ids = [self.pk]
+        curr = self
+        while curr.parent_id is not None:
+            curr = curr.parent
+            slot_ids.append(curr.pk)
+
+        EventParticipationSlot.objects.filter(pk__in=slot_ids).mark_scores_outdated()
+        self._auto_score_outdated = True
+        self._auto_score_version += 1
+
     @score.setter
     def score(self, value):
         self._score = value
@@ -1013,8 +1325,16 @@ class EventParticipationSlot(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        creating = self.pk is None
         super().save(*args, **kwargs)
 
+        update_fields = kwargs.get("update_fields")
+        if not creating and (
+            update_fields is None
+            or any(f not in self.BOOKKEEPING_FIELDS for f in update_fields)
+        ):
+            self.mark_score_outdated()
+
         # run on transaction commit because, for multiple choice exercises,
         # it'll check whether a selected choice exists (i.e. a record in the
         # m2m table exists), but the record won't be visible yet because
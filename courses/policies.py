@@ -8,7 +8,6 @@ from .models import Event, EventTemplate
 
 class BaseAccessPolicy(AccessPolicy):
     def has_teacher_privileges(self, request, view, action, privilege):
-        from courses.models import Course
         from courses.views import CourseViewSet
 
         course_pk = (
@@ -18,12 +17,10 @@ class BaseAccessPolicy(AccessPolicy):
         )
 
         try:
-            course = Course.objects.get(pk=course_pk)
+            return check_privilege(request.user, course_pk, privilege)
         except ValueError:
             return False
 
-        return check_privilege(request.user, course, privilege)
-
 
 class CoursePolicy(BaseAccessPolicy):
     statements = [
@@ -102,6 +99,12 @@ class EventPolicy(BaseAccessPolicy):
             "effect": "allow",
             "condition_expression": "has_teacher_privileges:manage_events",
         },
+        {
+            "action": ["rerun_submissions"],
+            "principal": ["authenticated"],
+            "effect": "allow",
+            "condition_expression": "has_teacher_privileges:assess_participations",
+        },
         {
             "action": ["retrieve"],
             "principal": ["authenticated"],
@@ -179,6 +182,7 @@ class ExercisePolicy(BaseAccessPolicy):
                 "destroy",
                 "tags",
                 "solution_execution_results",
+                "rerun_submissions",
             ],
             "principal": ["authenticated"],
             "effect": "allow",
@@ -1,7 +1,7 @@
 import random
 
 from django.db import models
-from django.db.models import Q, aggregates
+from django.db.models import Exists, F, OuterRef, Q, aggregates
 from django.db.models.aggregates import Max, Min
 from django.db.models import Prefetch
 
@@ -60,19 +60,27 @@ class ExerciseQuerySet(models.QuerySet):
         if rule.rule_type == EventTemplateRule.ID_BASED:
             ret_qs = ret_qs.filter(pk__in=[e.pk for e in rule.exercises.all()])
         elif rule.rule_type == EventTemplateRule.TAG_BASED:
+            # each clause is compiled into an EXISTS subquery over the tag
+            # through tables, which avoids joining the tag tables once per
+            # clause and having to de-duplicate the results afterwards
             for clause in rule.clauses.all():
-                clause_tags = clause.tags.all()
-                if not clause_tags.exists():  # empty clause
+                # evaluating `all()` reuses the clause's tags if prefetched
+                clause_tag_ids = [t.pk for t in clause.tags.all()]
+                if len(clause_tag_ids) == 0:  # empty clause
                     continue
-                # TODO test
-                qs_filter = Q(public_tags__in=clause_tags)
+                qs_filter = Exists(
+                    Exercise.public_tags.through.objects.filter(
+                        exercise_id=OuterRef("pk"), tag_id__in=clause_tag_ids
+                    )
+                )
                 if not rule.search_public_tags_only:
-                    qs_filter |= Q(private_tags__in=clause_tags)
+                    qs_filter |= Exists(
+                        Exercise.private_tags.through.objects.filter(
+                            exercise_id=OuterRef("pk"), tag_id__in=clause_tag_ids
+                        )
+                    )
 
                 ret_qs = ret_qs.filter(qs_filter)
-            ret_qs = (
-                ret_qs.distinct()
-            )  # if more than one tag match, an item may be returned more than once
         return ret_qs
 
     def get_random(self, amount=1):
@@ -96,6 +104,19 @@ class ExerciseQuerySet(models.QuerySet):
 
 
 class EventParticipationQuerySet(models.QuerySet):
+    def assigned(self):
+        """
+        Returns the participations that belong to a user
+        """
+        return self.filter(user__isnull=False)
+
+    def unassigned(self):
+        """
+        Returns the pre-generated participations that haven't
+        been claimed by any user yet
+        """
+        return self.filter(user__isnull=True)
+
     def with_prefetched_base_slots(self):
         from courses.models import EventParticipationSlot
 
@@ -122,6 +143,54 @@ class EventParticipationQuerySet(models.QuerySet):
             )
         )
 
+    def with_prefetched_assessment_grid(self):
+        """
+        Prefetches everything needed to serialize the participations with all
+        the details of their slots, i.e. the slots, their sub-slots, exercises,
+        choices, test cases, tags, selected choices, and populating rules.
+
+        The number of queries doesn't depend on the number of participations:
+        the participations to an event share their exercises and rules, which
+        are loaded once for all of them
+        """
+        from courses.models import EventParticipationSlot
+
+        exercise_lookups = [
+            "exercise__choices",
+            "exercise__testcases",
+            "exercise__public_tags",
+            "exercise__private_tags",
+            "exercise__sub_exercises",
+            "exercise__sub_exercises__choices",
+            "exercise__sub_exercises__testcases",
+            "exercise__sub_exercises__private_tags",
+            "exercise__sub_exercises__public_tags",
+            "exercise__sub_exercises__sub_exercises",
+        ]
+
+        sub_slots = EventParticipationSlot.objects.select_related(
+            "exercise", "exercise__locked_by"
+        ).prefetch_related("selected_choices", *exercise_lookups)
+
+        return self.prefetch_related(
+            Prefetch(
+                "slots",
+                queryset=EventParticipationSlot.objects.base_slots()
+                .select_related("exercise", "exercise__locked_by", "populating_rule")
+                .prefetch_related(
+                    "selected_choices",
+                    *exercise_lookups,
+                    Prefetch(
+                        "sub_slots",
+                        queryset=sub_slots.prefetch_related(
+                            Prefetch("sub_slots", queryset=sub_slots)
+                        ),
+                    ),
+                ),
+                to_attr="prefetched_base_slots",
+            )
+        )
+
 
 class SlotModelQuerySet(models.QuerySet):
     def base_slots(self):
@@ -131,6 +200,24 @@ class SlotModelQuerySet(models.QuerySet):
         """
         return self.filter(parent__isnull=True)
 
+    def mark_scores_outdated(self):
+        """
+        Marks the stored scores of the slots in the queryset, and of the
+        participations they belong to, as outdated
+        """
+        from courses.models import EventParticipation
+
+        EventParticipation.objects.filter(
+            pk__in=self.values("participation_id")
+        ).update(
+            _auto_score_outdated=True,
+            _auto_score_version=F("_auto_score_version") + 1,
+        )
+        return self.update(
+            _auto_score_outdated=True,
+            _auto_score_version=F("_auto_score_version") + 1,
+        )
+
 
 class CourseQuerySet(models.QuerySet):
     def public(self):
@@ -0,0 +1,217 @@
+"""
+Plain-function counterparts of the serializers used to read participations
+and slots, for the endpoints that are hit the most during an exam.
+
+Each function takes an instance (whose related objects are expected to be
+prefetched) and the same context as the corresponding serializer, and returns
+the same data, in the same order, that the serializer would. They skip the
+work DRF does for each serialized object, like instantiating and binding
+fields and nested serializers.
+"""
+import os
+import re
+
+from rest_framework import serializers
+
+from courses.logic.exercise_fragments import (
+    get_exercise_fragment,
+    get_exercise_fragments,
+    serialize_user,
+)
+from courses.logic.presentation import (
+    EVENT_PARTICIPATION_SHOW_EVENT,
+    EVENT_PARTICIPATION_SHOW_SCORE,
+    EVENT_PARTICIPATION_SHOW_SLOTS,
+    EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES,
+    EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS,
+    EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE,
+    EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS,
+)
+from courses.logic.participations import share_participation_with_sub_slots
+from courses.serializers import EventSerializer
+
+# fields used to format values the same way as the serializers' fields
+_datetime_field = serializers.DateTimeField()
+_score_field = serializers.DecimalField(max_digits=5, decimal_places=2)
+_weight_field = serializers.DecimalField(max_digits=5, decimal_places=1)
+
+
+def _format(field, value):
+    return None if value is None else field.to_representation(value)
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+def get_slot_attachment_extras(slot):
+    return {"slot_id": slot.pk, "participation_id": slot.participation.pk}
+
+
+def serialize_attachment(attachment, extras):
+    if not attachment:
+        return None
+    return {
+        "name": os.path.split(attachment.name)[1],
+        "size": attachment.size,
+        "extras": extras,
+    }
+
+
+def serialize_event_participation_slot(
+    slot, context, attachment_extras=None, exercise_fragments=None
+):
+    """
+    Returns the same data as EventParticipationSlotSerializer. Like the
+    serializer does, the attachment of the slot is given the extras of the
+    slot the serializer was instantiated with, passed as `attachment_extras`.
+
+    The data of the exercises is taken from `exercise_fragments` if given,
+    otherwise from the cache
+    """
+    capabilities = context.get("capabilities", {})
+    show_detail_fields = context.get(EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS, False)
+    show_exercise = show_detail_fields and context.get(
+        EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE, False
+    )
+    show_submission_fields = context.get(
+        EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS, False
+    )
+
+    ret = {"id": slot.pk, "slot_number": slot.slot_number}
+    if show_exercise:
+        normalized_exercises = context.get(
+            EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES
+        )
+        if normalized_exercises is not None:
+            # the exercises of sub-slots are included in the one of their parent
+            if slot.parent_id is None:
+                normalized_exercises[slot.exercise_id] = slot.exercise
+            ret["exercise"] = slot.exercise_id
+        elif exercise_fragments is not None:
+            ret["exercise"] = exercise_fragments[slot.exercise_id]
+        else:
+            ret["exercise"] = get_exercise_fragment(slot.exercise, context)
+    if show_detail_fields:
+        # sub-slots are serialized without attachment extras
+        ret["sub_slots"] = [
+            serialize_event_participation_slot(s, context, {}, exercise_fragments)
+            for s in slot.sub_slots.all()
+        ]
+    ret["seen_at"] = _format(_datetime_field, slot.seen_at)
+    ret["answered_at"] = _format(_datetime_field, slot.answered_at)
+    if show_detail_fields:
+        ret["is_first"] = slot.participation.is_cursor_first_position
+        ret["is_last"] = slot.participation.is_cursor_last_position
+    ret["has_answer"] = slot.has_answer
+    if slot.populating_rule is not None:
+        # sub-slots don't have a populating rule, and the serializer skips the
+        # field for them
+        ret["weight"] = _format(_weight_field, slot.populating_rule.weight)
+
+    if capabilities.get("assessment_fields_read", False):
+        try:
+            score = slot.score
+        except AttributeError:
+            # sub-slots don't have a populating rule, which is needed to assess
+            # them on their own, and the serializer's nullable field gives None
+            score = None
+        ret["score"] = _format(_score_field, score)
+        ret["comment"] = slot.comment
+        ret["score_edited"] = slot.score_edited
+
+    if capabilities.get("submission_fields_read", False):
+        if show_submission_fields:
+            ret["selected_choices"] = [c.pk for c in slot.selected_choices.all()]
+        ret["attachment"] = serialize_attachment(
+            slot.attachment,
+            attachment_extras
+            if attachment_extras is not None
+            else get_slot_attachment_extras(slot),
+        )
+        if show_submission_fields:
+            ret["answer_text"] = (
+                trim_answer_text(slot.answer_text)
+                if context.get("trim_images_in_text", False)
+                else slot.answer_text
+            )
+        ret["execution_results"] = slot.execution_results
+
+    return ret
+
+
+def trim_answer_text(text):
+    text = re.sub(r'src="([^"]+)"', "", text)
+    text = re.sub(r"</?p( style=('|\")[^\"']*('|\"))?>", "", text)
+    return text
+
+
+def get_slots_exercises(slots):
+    """
+    Returns the exercises of the given slots and of their sub-slots
+    """
+    ret = []
+    for slot in slots:
+        ret.append(slot.exercise)
+        ret.extend(get_slots_exercises(slot.sub_slots.all()))
+    return ret
+
+
+def serialize_event_participation(participation, context):
+    """
+    Returns the same data as EventParticipationSerializer
+    """
+    capabilities = context.get("capabilities", {})
+
+    ret = {"id": participation.pk, "state": participation.state}
+    if context.get(EVENT_PARTICIPATION_SHOW_SLOTS, False):
+        if capabilities.get("assessment_fields_read", False):
+            # accessing outside of active participation - show all slots
+            slots = participation.prefetched_base_slots
+        else:
+            slots = participation.current_slots
+        slots = list(slots)
+        share_participation_with_sub_slots(participation, slots)
+        attachment_extras = (
+            get_slot_attachment_extras(slots[0]) if len(slots) > 0 else {}
+        )
+        show_exercises = (
+            context.get(EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS, False)
+            and context.get(EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE, False)
+            and context.get(EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES) is None
+        )
+        # get the data of all the exercises from the cache at once
+        exercise_fragments = (
+            get_exercise_fragments(get_slots_exercises(slots), context)
+            if show_exercises
+            else None
+        )
+        ret["slots"] = [
+            serialize_event_participation_slot(
+                s, context, attachment_extras, exercise_fragments
+            )
+            for s in slots
+        ]
+    ret["user"] = serialize_user(participation.user)
+    ret["begin_timestamp"] = _format(_datetime_field, participation.begin_timestamp)
+    ret["end_timestamp"] = _format(_datetime_field, participation.end_timestamp)
+    if context.get(EVENT_PARTICIPATION_SHOW_EVENT, False):
+        ret["event"] = EventSerializer(
+            participation.event, read_only=True, context=context
+        ).data
+    ret["last_slot_number"] = participation.last_slot_number
+    ret["current_slot_cursor"] = participation.current_slot_cursor
+    ret["bookmarked"] = participation.bookmarked
+
+    if capabilities.get("assessment_fields_read", False):
+        ret["score"] = _str(participation.score)
+        ret["score_edited"] = participation.score_edited
+        ret["assessment_progress"] = participation.assessment_progress
+        ret["visibility"] = participation.assessment_visibility
+    elif context.get(EVENT_PARTICIPATION_SHOW_SCORE, False):
+        ret["score"] = participation.score
+
+    if capabilities.get("submission_fields_read", False):
+        ret["assessment_available"] = participation.is_assessment_available
+
+    return ret
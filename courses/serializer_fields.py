@@ -67,10 +67,9 @@ class RecursiveField(Field):
         self._proxied = None
 
         # need to call super-constructor to support ModelSerializer
+        field_init_parameters = _signature_parameters(Field.__init__)
         super_kwargs = dict(
-            (key, kwargs[key])
-            for key in kwargs
-            if key in _signature_parameters(Field.__init__)
+            (key, kwargs[key]) for key in kwargs if key in field_init_parameters
         )
         super(RecursiveField, self).__init__(**super_kwargs)
 
@@ -109,8 +108,11 @@ class RecursiveField(Field):
                     except Exception as e:
                         raise ImportError("could not locate serializer %s" % self.to, e)
 
-                # Create a new serializer instance and proxy it
-                proxied = proxied_class(**self.init_kwargs)
+                # Create a new serializer instance and proxy it, using the
+                # context of the parent unless one was given explicitly
+                proxied = proxied_class(
+                    **{"context": parent.context, **self.init_kwargs}
+                )
                 proxied.bind(field_name, parent)
                 self._proxied = proxied
 
@@ -1,12 +1,19 @@
+import copy
+
 from django.db.models import Exists, OuterRef
 from rest_framework import serializers
-from courses.logic.participations import get_effective_time_limit
+from courses.logic.exercise_fragments import get_exercise_fragment
+from courses.logic.participations import (
+    get_effective_time_limit,
+    share_participation_with_sub_slots,
+)
 from courses.logic.presentation import (
     CHOICE_SHOW_SCORE_FIELDS,
     COURSE_SHOW_PUBLIC_EXERCISES_COUNT,
     EVENT_PARTICIPATION_SHOW_EVENT,
     EVENT_PARTICIPATION_SHOW_SCORE,
     EVENT_PARTICIPATION_SHOW_SLOTS,
+    EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES,
     EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS,
     EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE,
     EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS,
@@ -50,17 +57,80 @@ class HiddenFieldsModelSerializer(serializers.ModelSerializer):
     pass
 
 
+# fields of the serializers using ConditionalFieldsMixin, by serializer class
+# and values of the context entries that determine them
+_fields_cache = {}
+
+
+def copy_field(field):
+    """
+    Returns a copy of the field that can be bound to a new serializer. Binding
+    a field only sets its name and parent, so a shallow copy is enough unless
+    the field contains other fields, which are bound to it
+    """
+    if isinstance(
+        field,
+        (
+            serializers.BaseSerializer,
+            serializers.ManyRelatedField,
+            serializers.ListField,
+            serializers.DictField,
+            RecursiveField,
+        ),
+    ):
+        return copy.deepcopy(field)
+    return copy.copy(field)
+
+
 class ConditionalFieldsMixin:
-    def remove_unsatisfied_condition_fields(self):
+    """
+    Removes the fields listed in `Meta.conditional_fields` under a context
+    entry that isn't truthy.
+
+    Serializers are often instantiated once per object (e.g. in a
+    SerializerMethodField), so their fields are built once for each
+    combination of the context values they depend on, and copied into new
+    instances. Serializers whose fields depend on other context entries must
+    include them in `get_fields_cache_key`, and add fields that depend on the
+    instance in `get_fields`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # build the fields from the context passed to the serializer, before
+        # it's bound to a parent serializer
+        self.fields
+
+    def get_fields_cache_key(self):
+        return tuple(
+            bool(self.context.get(condition, False))
+            for condition in self.Meta.conditional_fields
+        )
+
+    def get_fields(self):
+        key = (self.__class__, self.get_fields_cache_key())
+        if key not in _fields_cache:
+            _fields_cache[key] = self.build_fields()
+        return {
+            field_name: copy_field(field)
+            for field_name, field in _fields_cache[key].items()
+        }
+
+    def build_fields(self):
+        fields = super().get_fields()
+        self.remove_unsatisfied_condition_fields(fields)
+        return fields
+
+    def remove_unsatisfied_condition_fields(self, fields):
         conditional_fields = self.Meta.conditional_fields
 
-        for condition, fields in conditional_fields.items():
+        for condition, field_names in conditional_fields.items():
             if not self.context.get(condition, False):
-                for field in fields:
-                    self.fields.pop(field, None)
+                for field_name in field_names:
+                    fields.pop(field_name, None)
 
 
-class CourseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class CourseSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     privileges = serializers.SerializerMethodField()
     creator = UserSerializer(read_only=True)
     public_exercises_count = serializers.SerializerMethodField()
@@ -81,10 +151,6 @@ class CourseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
             COURSE_SHOW_PUBLIC_EXERCISES_COUNT: ["public_exercises_count"]
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
-
     def get_privileges(self, obj):
         return get_user_privileges(self.context["request"].user, obj)
 
@@ -92,7 +158,7 @@ class CourseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
         return obj.exercises.public().count()
 
 
-class TagSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class TagSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     public_exercises = serializers.SerializerMethodField()
     public_exercises_not_seen = serializers.SerializerMethodField()
 
@@ -107,10 +173,6 @@ class TagSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
             ]
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
-
     def get_public_exercises(self, obj):
         return len(obj.prefetched_public_in_public_exercises)
 
@@ -128,7 +190,7 @@ class CourseRoleSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "allow_privileges"]
 
 
-class ExerciseChoiceSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class ExerciseChoiceSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     _ordering = serializers.IntegerField(required=False)
 
     class Meta:
@@ -141,12 +203,8 @@ class ExerciseChoiceSerializer(serializers.ModelSerializer, ConditionalFieldsMix
             ]
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
 
-
-class ExerciseTestCaseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class ExerciseTestCaseSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     _ordering = serializers.IntegerField(required=False)
 
     class Meta:
@@ -165,21 +223,19 @@ class ExerciseTestCaseSerializer(serializers.ModelSerializer, ConditionalFieldsM
             TESTCASE_SHOW_HIDDEN_FIELDS: ["testcase_type", "code", "text"]
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
+    def build_fields(self):
+        fields = super().build_fields()
 
-        self.TESTCASE_SHOW_HIDDEN_FIELDS = self.context.get(
-            TESTCASE_SHOW_HIDDEN_FIELDS, False
-        )
-        if not self.TESTCASE_SHOW_HIDDEN_FIELDS:
+        if not self.context.get(TESTCASE_SHOW_HIDDEN_FIELDS, False):
             # for unauthorized users, overwrite code and text
             # fields to enforce visibility rule
-            self.add_relevant_public_info_fields()
+            self.add_relevant_public_info_fields(fields)
 
-    def add_relevant_public_info_fields(self):
-        self.fields["code"] = serializers.SerializerMethodField()
-        self.fields["text"] = serializers.SerializerMethodField()
+        return fields
+
+    def add_relevant_public_info_fields(self, fields):
+        fields["code"] = serializers.SerializerMethodField()
+        fields["text"] = serializers.SerializerMethodField()
 
     def get_code(self, obj):
         return (
@@ -197,7 +253,7 @@ class ExerciseTestCaseSerializer(serializers.ModelSerializer, ConditionalFieldsM
         )
 
 
-class ExerciseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class ExerciseSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     public_tags = TagSerializer(many=True, required=False)
     private_tags = TagSerializer(many=True, required=False)
     text = serializers.CharField(trim_whitespace=False, allow_blank=True)
@@ -236,20 +292,24 @@ class ExerciseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
         kwargs.pop("required", None)  # TODO remove this
         super().__init__(*args, **kwargs)
 
-        self.remove_unsatisfied_condition_fields()
+    def get_fields_cache_key(self):
+        return (
+            super().get_fields_cache_key(),
+            self.context.get("show_choices", True),
+            self.context.get("show_testcases", True),
+        )
+
+    def build_fields(self):
+        fields = super().build_fields()
 
         # TODO you might only show this to teachers (students will always only see exercises through slots)
-        self.fields["sub_exercises"] = RecursiveField(
+        fields["sub_exercises"] = RecursiveField(
             many=True,
             required=False,
-            context=self.context,
         )
 
-        # list serializer would pass this down to choice serializer, having parameter twice
-        kwargs.pop("many", False)
-
-        if self.context.pop("show_choices", True):
-            self.fields["choices"] = ExerciseChoiceSerializer(
+        if self.context.get("show_choices", True):
+            fields["choices"] = ExerciseChoiceSerializer(
                 many=True,
                 required=False,
                 context={
@@ -258,8 +318,8 @@ class ExerciseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
                     )
                 },
             )
-        if self.context.pop("show_testcases", True):
-            self.fields["testcases"] = ExerciseTestCaseSerializer(
+        if self.context.get("show_testcases", True):
+            fields["testcases"] = ExerciseTestCaseSerializer(
                 many=True,
                 required=False,
                 context={
@@ -269,6 +329,8 @@ class ExerciseSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
                 },
             )
 
+        return fields
+
     def create(self, validated_data):
         public_tags = validated_data.pop("public_tags", [])
         private_tags = validated_data.pop("private_tags", [])
@@ -309,7 +371,7 @@ class EventTemplateRuleClauseSerializer(serializers.ModelSerializer):
         fields = ["id", "tags"]
 
 
-class EventTemplateRuleSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class EventTemplateRuleSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     clauses = EventTemplateRuleClauseSerializer(many=True, read_only=True)
     _ordering = serializers.IntegerField(required=False)
     satisfying = serializers.SerializerMethodField()
@@ -332,19 +394,16 @@ class EventTemplateRuleSerializer(serializers.ModelSerializer, ConditionalFields
             EVENT_TEMPLATE_RULE_SHOW_SATISFYING_FIELD: ["satisfying"]
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
-
     def get_satisfying(self, obj):
-        qs = Exercise.objects.filter(course=obj.template.event.course).satisfying(obj)
+        qs = Exercise.objects.filter(course_id=obj.template.course_id).satisfying(obj)
+        count = qs.count()
 
         return {
-            "count": qs.count(),
+            "count": count,
             "example": ExerciseSerializer(
                 qs.first(), context={EXERCISE_SHOW_HIDDEN_FIELDS: True}
             ).data
-            if qs.count() > 0
+            if count > 0
             else None,
         }
 
@@ -363,7 +422,7 @@ class EventTemplateSerializer(serializers.ModelSerializer):
         ).data
 
 
-class EventSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class EventSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     id = HashidSerializerCharField(source_field="courses.Event.id", read_only=True)
     state = ReadWriteSerializerMethodField()
     locked_by = UserSerializer(read_only=True)
@@ -399,6 +458,7 @@ class EventSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
             "time_limit_seconds",
             "time_limit_exceptions",
             "max_score",
+            "participation_pool_size",
         ]
 
         conditional_fields = {
@@ -409,20 +469,22 @@ class EventSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
                 "access_rule",
                 "access_rule_exceptions",
                 "time_limit_exceptions",
+                "participation_pool_size",
             ],
             EVENT_SHOW_TEMPLATE: ["template"],
             EVENT_SHOW_PARTICIPATION_EXISTS: ["participation_exists"],
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
+    def build_fields(self):
+        fields = super().build_fields()
 
         if not self.context.get(EVENT_SHOW_HIDDEN_FIELDS, False):
             # if user is a student, replace field with a read-only
             # method field that displays the effective time limit for
             # them taking into account exceptions
-            self.fields["time_limit_seconds"] = serializers.SerializerMethodField()
+            fields["time_limit_seconds"] = serializers.SerializerMethodField()
+
+        return fields
 
     def get_time_limit_seconds(self, obj):
         return get_effective_time_limit(self.context["request"].user, obj)
@@ -432,7 +494,7 @@ class EventSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
         user = self.context["request"].user
         if state == Event.RESTRICTED and not check_privilege(
             user,
-            obj.course,
+            obj.course_id,
             MANAGE_EVENTS,
         ):
             return (
@@ -461,7 +523,7 @@ class EventSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
 
 
 class EventParticipationSlotSerializer(
-    serializers.ModelSerializer, ConditionalFieldsMixin
+    ConditionalFieldsMixin, serializers.ModelSerializer
 ):
     exercise = serializers.SerializerMethodField()  # to pass context
     is_last = serializers.BooleanField(
@@ -512,29 +574,36 @@ class EventParticipationSlotSerializer(
             ],
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def get_fields_cache_key(self):
+        capabilities = self.context.get("capabilities", {})
+        return (
+            super().get_fields_cache_key(),
+            tuple(sorted(capabilities.items())),
+            self.context.get("trim_images_in_text", False),
+        )
+
+    def build_fields(self):
+        fields = super().build_fields()
 
         capabilities = self.context.get("capabilities", {})
 
-        self.fields["sub_slots"] = RecursiveField(
+        fields["sub_slots"] = RecursiveField(
             many=True,
             read_only=True,
-            context=self.context,
         )
 
         if capabilities.get("assessment_fields_read", False):
             assessment_fields_write = capabilities.get("assessment_fields_write", False)
-            self.fields["score"] = serializers.DecimalField(
+            fields["score"] = serializers.DecimalField(
                 max_digits=5,
                 decimal_places=2,
                 allow_null=True,
                 read_only=(not assessment_fields_write),
             )
-            self.fields["comment"] = serializers.CharField(
+            fields["comment"] = serializers.CharField(
                 read_only=(not assessment_fields_write), allow_blank=True
             )
-            self.fields["score_edited"] = serializers.BooleanField(
+            fields["score_edited"] = serializers.BooleanField(
                 read_only=True,
             )
 
@@ -543,10 +612,30 @@ class EventParticipationSlotSerializer(
             selected_choices_kwargs = {"read_only": (not submission_fields_write)}
             if not selected_choices_kwargs["read_only"]:
                 selected_choices_kwargs["queryset"] = ExerciseChoice.objects.all()
-            self.fields["selected_choices"] = serializers.PrimaryKeyRelatedField(
+            fields["selected_choices"] = serializers.PrimaryKeyRelatedField(
                 many=True, **selected_choices_kwargs
             )
+            # extras are set for each instance of the serializer in get_fields
+            fields["attachment"] = FileWithPreviewField(
+                read_only=(not submission_fields_write)
+            )
+            if self.context.get("trim_images_in_text", False):
+                fields["answer_text"] = serializers.SerializerMethodField()
+            else:
+                fields["answer_text"] = serializers.CharField(
+                    read_only=(not submission_fields_write),
+                    allow_blank=True,
+                )
+            fields["execution_results"] = serializers.JSONField(read_only=True)
 
+        # some of the fields added above are conditional
+        self.remove_unsatisfied_condition_fields(fields)
+        return fields
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        if "attachment" in fields:
             # TODO find a better way to handle attachment
             # pass slot and participation id's to file field's extras
             attachment_extras = {}
@@ -559,23 +648,23 @@ class EventParticipationSlotSerializer(
                 if instance is not None:
                     attachment_extras["slot_id"] = instance.pk
                     attachment_extras["participation_id"] = instance.participation.pk
+            fields["attachment"].extras = attachment_extras
 
-            self.fields["attachment"] = FileWithPreviewField(
-                read_only=(not submission_fields_write), extras=attachment_extras
-            )
-            if self.context.get("trim_images_in_text", False):
-                self.fields["answer_text"] = serializers.SerializerMethodField()
-            else:
-                self.fields["answer_text"] = serializers.CharField(
-                    read_only=(not submission_fields_write),
-                    allow_blank=True,
-                )
-            self.fields["execution_results"] = serializers.JSONField(read_only=True)
-
-        self.remove_unsatisfied_condition_fields()
+        return fields
 
     def get_exercise(self, obj):
-        return ExerciseSerializer(obj.exercise, context=self.context).data
+        normalized_exercises = self.context.get(
+            EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES
+        )
+        if normalized_exercises is not None:
+            # the exercise is serialized once for all the slots referencing it;
+            # the exercises of sub-slots are included in the one of their parent
+            if obj.parent_id is None:
+                normalized_exercises[obj.exercise_id] = obj.exercise
+            return obj.exercise_id
+
+        # exercises rarely change, so their data is cached
+        return get_exercise_fragment(obj.exercise, self.context)
 
     def get_answer_text(self, obj):
         """
@@ -588,7 +677,7 @@ class EventParticipationSlotSerializer(
         return text
 
 
-class EventParticipationSerializer(serializers.ModelSerializer, ConditionalFieldsMixin):
+class EventParticipationSerializer(ConditionalFieldsMixin, serializers.ModelSerializer):
     event = serializers.SerializerMethodField()  # to pass context
     slots = serializers.SerializerMethodField()  # to pass context
     user = UserSerializer(read_only=True)
@@ -615,35 +704,38 @@ class EventParticipationSerializer(serializers.ModelSerializer, ConditionalField
             EVENT_PARTICIPATION_SHOW_EVENT: ["event"],
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.remove_unsatisfied_condition_fields()
+    def get_fields_cache_key(self):
+        capabilities = self.context.get("capabilities", {})
+        return (super().get_fields_cache_key(), tuple(sorted(capabilities.items())))
+
+    def build_fields(self):
+        fields = super().build_fields()
 
         capabilities = self.context.get("capabilities", {})
 
         if capabilities.get("assessment_fields_read", False):
             # include teacher fields
             assessment_fields_write = capabilities.get("assessment_fields_write", False)
-            self.fields["score"] = serializers.CharField(
+            fields["score"] = serializers.CharField(
                 allow_null=True,
                 read_only=(not assessment_fields_write),
             )
-            self.fields["score_edited"] = serializers.BooleanField(
+            fields["score_edited"] = serializers.BooleanField(
                 read_only=True,
             )
-            self.fields["assessment_progress"] = serializers.IntegerField(
-                read_only=True
-            )
-            self.fields["visibility"] = serializers.IntegerField(
+            fields["assessment_progress"] = serializers.IntegerField(read_only=True)
+            fields["visibility"] = serializers.IntegerField(
                 source="assessment_visibility",
                 read_only=(not assessment_fields_write),
             )
 
         if capabilities.get("submission_fields_read", False):  # student fields
-            self.fields["assessment_available"] = serializers.BooleanField(
+            fields["assessment_available"] = serializers.BooleanField(
                 source="is_assessment_available", read_only=True
             )
 
+        return fields
+
     def get_event(self, obj):
         return EventSerializer(obj.event, read_only=True, context=self.context).data
 
@@ -651,6 +743,7 @@ class EventParticipationSerializer(serializers.ModelSerializer, ConditionalField
         if self.context.get("capabilities").get("assessment_fields_read", False):
             # accessing outside of active participation - show all slots
             slots = obj.prefetched_base_slots
+            share_participation_with_sub_slots(obj, slots)
         else:
             slots = obj.current_slots
 
@@ -0,0 +1,206 @@
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import User
+
+from courses.logic.privileges import bump_privileges_version
+from courses.models import (
+    CourseRole,
+    Event,
+    EventParticipationSlot,
+    EventTemplateRule,
+    EventTemplateRuleClause,
+    Exercise,
+    Tag,
+)
+
+
+def refresh_participation_pools(**filters):
+    """
+    Regenerates the participation pools of the events matching the given filters,
+    which might not reflect their templates anymore
+    """
+    for event in Event.objects.filter(
+        _event_state__in=(Event.PLANNED, Event.OPEN),
+        event_type__in=Event.POOLED_EVENT_TYPES,
+        **filters,
+    ).distinct():
+        event.refresh_participation_pool()
+
+
+@receiver(m2m_changed, sender=EventParticipationSlot.selected_choices.through)
+def on_selected_choices_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Marks the score of slots as outdated when their selected choices change
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.mark_score_outdated()
+        return
+
+    # `instance` is a choice and `pk_set` contains the affected slots
+    if action in ("post_add", "post_remove"):
+        slots = EventParticipationSlot.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        slots = instance.eventparticipationslot_set.all()
+    else:
+        return
+
+    for slot in slots:
+        slot.mark_score_outdated()
+
+
+@receiver(m2m_changed, sender=User.roles.through)
+def on_user_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalidates the cached privileges for the courses of the roles that
+    have been assigned to or removed from users
+    """
+    if reverse:
+        # `instance` is a role
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_privileges_version(instance.course_id)
+        return
+
+    if action in ("post_add", "post_remove"):
+        course_ids = CourseRole.objects.filter(pk__in=pk_set).values_list(
+            "course_id", flat=True
+        )
+    elif action == "pre_clear":
+        course_ids = instance.roles.values_list("course_id", flat=True)
+    else:
+        return
+
+    for course_id in set(course_ids):
+        bump_privileges_version(course_id)
+
+
+@receiver(m2m_changed, sender=Event.users_allowed_past_closure.through)
+def on_users_allowed_past_closure_changed(sender, instance, action, reverse, **kwargs):
+    """
+    Closes or re-opens RESTRICTED events when the users allowed past their
+    closure change
+    """
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        instance.update_restricted_state()
+
+
+@receiver(m2m_changed, sender=Exercise.public_tags.through)
+@receiver(m2m_changed, sender=Exercise.private_tags.through)
+def on_exercise_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Marks exercises as modified when their tags change
+    """
+    if action in ("post_add", "post_remove", "post_clear"):
+        # the exercises matched by tag-based rules might have changed
+        refresh_participation_pools(
+            course_id=instance.course_id,
+            template__rules__rule_type=EventTemplateRule.TAG_BASED,
+        )
+
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.mark_modified()
+        return
+
+    # `instance` is a tag and `pk_set` contains the affected exercises
+    if action in ("post_add", "post_remove"):
+        exercises = Exercise.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        exercises = Exercise.objects.filter(
+            Q(public_tags=instance) | Q(private_tags=instance)
+        ).distinct()
+    else:
+        return
+
+    for exercise in exercises:
+        exercise.mark_modified()
+
+
+@receiver(post_save, sender=Tag)
+def on_tag_saved(sender, instance, created, **kwargs):
+    """
+    Marks the exercises having a tag as modified when the tag changes
+    """
+    if created:
+        return
+
+    for exercise in Exercise.objects.filter(
+        Q(public_tags=instance) | Q(private_tags=instance)
+    ).distinct():
+        exercise.mark_modified()
+
+
+@receiver(pre_delete, sender=Tag)
+def on_tag_deleted(sender, instance, **kwargs):
+    """
+    Marks the exercises having a tag as modified when the tag is deleted, which
+    doesn't send m2m_changed, whether it's deleted directly or by cascade, and
+    regenerates the participation pools of the events whose rules refer to it
+    """
+    refresh_participation_pools(template__rules__clauses__tags=instance)
+
+    for exercise in Exercise.objects.filter(
+        Q(public_tags=instance) | Q(private_tags=instance)
+    ).distinct():
+        exercise.mark_modified()
+
+
+@receiver(post_save, sender=EventTemplateRule)
+@receiver(post_delete, sender=EventTemplateRule)
+def on_template_rule_changed(sender, instance, **kwargs):
+    """
+    Regenerates the participation pool of an event when its template rules change
+    """
+    refresh_participation_pools(template_id=instance.template_id)
+
+
+@receiver(post_save, sender=EventTemplateRuleClause)
+@receiver(pre_delete, sender=EventTemplateRuleClause)
+def on_template_rule_clause_changed(sender, instance, **kwargs):
+    """
+    Regenerates the participation pool of an event when the clauses of its
+    template rules change
+    """
+    # the rule of the clause still exists before the clause is deleted by cascade
+    refresh_participation_pools(template__rules=instance.rule_id)
+
+
+@receiver(m2m_changed, sender=EventTemplateRule.exercises.through)
+def on_template_rule_exercises_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Regenerates the participation pool of an event when the exercises of its
+    ID-based template rules change
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        refresh_participation_pools(template_id=instance.template_id)
+    elif action == "pre_clear":
+        # `instance` is an exercise
+        refresh_participation_pools(template__rules__exercises=instance)
+    else:
+        refresh_participation_pools(template__rules__in=pk_set)
+
+
+@receiver(m2m_changed, sender=EventTemplateRuleClause.tags.through)
+def on_template_rule_clause_tags_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Regenerates the participation pool of an event when the tags of the clauses
+    of its template rules change
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        refresh_participation_pools(template__rules__clauses=instance)
+    elif action == "pre_clear":
+        # `instance` is a tag
+        refresh_participation_pools(template__rules__clauses__tags=instance)
+    else:
+        refresh_participation_pools(template__rules__clauses__in=pk_set)
@@ -1,7 +1,10 @@
 import time
-from coding.helpers import get_code_execution_results
+from collections import defaultdict
+
+from coding.helpers import get_bulk_code_execution_results, get_code_execution_results
 from core.celery import app
-from courses.models import EventParticipationSlot
+from courses.logic.code_execution import complete_slot_run, is_current_slot_run
+from courses.models import Event, EventParticipation, EventParticipationSlot, Exercise
 from django.db import transaction
 
 from djangochannelsrestframework import *
@@ -18,17 +21,30 @@ channel_layer = get_channel_layer()
 
 
 @app.task(bind=True, retry_backoff=True, max_retries=5)
-def run_user_code_task(self, slot_id):
+def run_user_code_task(self, slot_id, token=None):
     """
     Takes in the id of a submission slot, runs the code in it, then
-    saves the results to its execution_results field
+    saves the results to its execution_results field. If a token is given
+    and a newer run of the slot has been requested in the meantime, the code
+    isn't run, as the task of the newer run will take care of it
     """
-    from courses.consumers import SubmissionSlotConsumer
+    if not is_current_slot_run(slot_id, token):
+        return
+
+    group_name = "submission_slot_" + str(slot_id)
 
-    slot = EventParticipationSlot.objects.get(id=slot_id)
+    def send_progress(test):
+        # stream the results of each test case as soon as they're available
+        async_to_sync(channel_layer.group_send)(
+            group_name, {"type": "execution.progress", "payload": test}
+        )
+
+    slot = EventParticipationSlot.objects.select_related("participation").get(
+        id=slot_id
+    )
     try:
         # run code and save outcome to slot
-        results = get_code_execution_results(slot=slot)
+        results = get_code_execution_results(slot=slot, on_progress=send_progress)
         slot.execution_results = results
         slot.save(update_fields=["execution_results"])
     except Exception as e:
@@ -39,8 +55,101 @@ def run_user_code_task(self, slot_id):
             slot.execution_results = {"state": "internal_error"}
             slot.save(update_fields=["execution_results"])
 
-    # send completion message to consumer
+    complete_slot_run(slot_id, slot.participation.user_id, token)
+
+    # send results to consumers, so they don't need to read them from the db
     async_to_sync(channel_layer.group_send)(
-        "submission_slot_" + str(slot_id),
-        {"type": "task_message", "action": "execution_complete", "pk": slot_id},
+        group_name,
+        {"type": "execution.results", "payload": slot.execution_results},
+    )
+
+
+# number of submissions whose results are written to the db at once
+BULK_CODE_EXECUTION_CHUNK_SIZE = 50
+
+
+@app.task
+def bulk_run_user_code_task(event_id=None, exercise_id=None):
+    """
+    Runs the code in all the submission slots of the given event, or of the
+    given exercise, and saves the results to their execution_results field.
+
+    Slots are grouped by exercise so that the testcases of each exercise are
+    loaded once, and are handed to the execution backend in chunks whose
+    results are written with a single query. Progress is sent to the consumers
+    subscribed to the event or exercise after each chunk
+    """
+    from courses.consumers import get_code_execution_group_name
+
+    slots = EventParticipationSlot.objects.filter(
+        exercise__exercise_type__in=[Exercise.JS, Exercise.C]
     )
+    if event_id is not None:
+        slots = slots.filter(participation__event_id=event_id)
+        group_name = get_code_execution_group_name("event", event_id)
+    else:
+        slots = slots.filter(exercise_id=exercise_id)
+        group_name = get_code_execution_group_name("exercise", exercise_id)
+
+    slots = list(slots.only("id", "exercise_id", "answer_text"))
+    exercises = Exercise.objects.prefetch_related("testcases").in_bulk(
+        {slot.exercise_id for slot in slots}
+    )
+    slots_by_exercise = defaultdict(list)
+    for slot in slots:
+        slots_by_exercise[slot.exercise_id].append(slot)
+
+    layer = get_channel_layer()
+    done = 0
+    for exercise_id, exercise_slots in slots_by_exercise.items():
+        exercise = exercises[exercise_id]
+        testcases = list(exercise.testcases.all())
+        for i in range(0, len(exercise_slots), BULK_CODE_EXECUTION_CHUNK_SIZE):
+            chunk = exercise_slots[i : i + BULK_CODE_EXECUTION_CHUNK_SIZE]
+            chunk_results = get_bulk_code_execution_results(
+                exercise, [slot.answer_text for slot in chunk], testcases
+            )
+            for slot, results in zip(chunk, chunk_results):
+                slot.execution_results = results
+            EventParticipationSlot.objects.bulk_update(chunk, ["execution_results"])
+
+            done += len(chunk)
+            async_to_sync(layer.group_send)(
+                group_name,
+                {
+                    "type": "code_execution_progress",
+                    "payload": {"done": done, "total": len(slots)},
+                },
+            )
+
+        # the scores of the slots depend on their execution results
+        exercise.mark_slot_scores_outdated()
+
+
+@app.task
+def create_participation_pool_task(event_id):
+    """
+    Generates unassigned participations to the given event until
+    the size of its participation pool is reached
+    """
+    with transaction.atomic():
+        # the pool of the event is discarded while it's generated if the event
+        # or its template change, see `Event.refresh_participation_pool`
+        event = Event.objects.select_for_update().filter(pk=event_id).first()
+        if event is None or event.state not in (Event.PLANNED, Event.OPEN):
+            return
+
+        missing = (
+            event.participation_pool_size - event.participations.unassigned().count()
+        )
+        if missing > 0:
+            EventParticipation.objects.create_pool(event, missing)
+
+
+@app.task
+def update_event_states_task():
+    """
+    Persists the state transitions of events which the Event.state property
+    computes on read without saving them
+    """
+    Event.objects.update_states()
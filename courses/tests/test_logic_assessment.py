@@ -1,12 +1,16 @@
 from decimal import Decimal
+from courses.logic.assessment import BatchAssessor
 from courses.models import (
     Course,
     Event,
     EventParticipation,
+    EventParticipationSlot,
     EventTemplateRule,
     Exercise,
 )
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from users.models import User
 
 from data import users, courses, exercises, events
@@ -171,6 +175,7 @@ class SubmissionAssessorTestCase(TestCase):
         incorrect_choice.correctness = -0.25
         incorrect_choice.save()
         self.slot_msc.selected_choices.set([incorrect_choice])
+        self.slot_msc.refresh_from_db()  # score was marked outdated via the choice
         self.assertEqual(self.slot_msc.score, -0.5)
 
         """
@@ -259,6 +264,7 @@ class SubmissionAssessorTestCase(TestCase):
 
         # 1 * 2 (first sub-exercise)  + 1 * 1 (second) + 1 * 1 (third)
         # ==> 4 / 4 * 2 = 2
+        self.slot_clz.refresh_from_db()  # score was marked outdated via sub-slots
         self.assertEqual(self.slot_clz.score, Decimal("2"))
 
         # one answer has negative score
@@ -268,8 +274,151 @@ class SubmissionAssessorTestCase(TestCase):
 
         # 1 * 2 (first sub-exercise)  - 0.1 * 1 (second) + 1 * 1 (third)
         # ==> 2.9 / 4 * 2 = 1.45
+        self.slot_clz.refresh_from_db()
         self.assertEqual(self.slot_clz.score, Decimal("1.45"))
 
+    def test_stored_scores(self):
+        """
+        Shows that the scores of slots and participations are stored and only
+        recomputed after something they depend on changes
+        """
+        correct_choice = self.msc.choices.get(correctness=1)
+        self.slot_msc.selected_choices.set([correct_choice])
+
+        # the open answer slot needs manual assessment and counts as 0
+        self.assertEqual(
+            EventParticipation.objects.get(pk=self.participation.pk).score, "2.00"
+        )
+
+        # once computed, scores are read from the db
+        participation = EventParticipation.objects.get(pk=self.participation.pk)
+        slot = participation.slots.get(pk=self.slot_msc.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(participation.score, "2.00")
+            self.assertEqual(slot.score, 2)
+
+        # changing the answer updates the scores
+        self.slot_msc.selected_choices.clear()
+        self.assertEqual(
+            EventParticipation.objects.get(pk=self.participation.pk).score, "0.00"
+        )
+
+        # changing the rule weight updates the scores
+        self.slot_msc.selected_choices.set([correct_choice])
+        self.rule_msc.weight = 5
+        self.rule_msc.save()
+        self.assertEqual(
+            EventParticipation.objects.get(pk=self.participation.pk).score, "5.00"
+        )
+
+        # manually assigned scores are taken into account
+        slot = self.participation.slots.get(pk=self.slot_open.pk)
+        slot.score = 3
+        slot.save()
+        self.assertEqual(
+            EventParticipation.objects.get(pk=self.participation.pk).score, "8.00"
+        )
+
+    def test_outdated_score_not_stored_after_concurrent_change(self):
+        """
+        Shows that a score computed before the slot is marked as outdated again
+        isn't stored as up to date
+        """
+        correct_choice = self.msc.choices.get(correctness=1)
+        self.slot_msc.selected_choices.set([correct_choice])
+
+        # the answers are read before they change
+        participation = (
+            EventParticipation.objects.all()
+            .with_prefetched_base_slots()
+            .get(pk=self.participation.pk)
+        )
+        slot = next(
+            s for s in participation.prefetched_base_slots if s.pk == self.slot_msc.pk
+        )
+        self.assertTrue(slot._auto_score_outdated)
+
+        # the answer changes while the scores are being computed
+        other_slot = EventParticipationSlot.objects.get(pk=self.slot_msc.pk)
+        other_slot.selected_choices.clear()
+
+        self.assertEqual(slot.score, 2)
+        self.assertEqual(participation.score, "2.00")
+
+        # the scores are still outdated, and are computed again next time
+        slot = EventParticipationSlot.objects.get(pk=self.slot_msc.pk)
+        participation = EventParticipation.objects.get(pk=self.participation.pk)
+        self.assertTrue(slot._auto_score_outdated)
+        self.assertTrue(participation._auto_score_outdated)
+        self.assertEqual(slot.score, 0)
+        self.assertEqual(participation.score, "0.00")
+
+    def test_batch_assessment(self):
+        """
+        Shows that BatchAssessor assigns the same scores as assessing each slot
+        on its own, with a number of queries that doesn't depend on the number
+        of participations
+        """
+        self.slot_msc.selected_choices.set([self.msc.choices.get(correctness=1)])
+        self.slot_mmc.selected_choices.set(self.mmc.choices.filter(correctness__gt=0))
+        sub_slot = self.slot_clz.sub_slots.first()
+        sub_slot.selected_choices.set(sub_slot.exercise.choices.filter(correctness=1))
+
+        with CaptureQueriesContext(connection) as context:
+            scores = BatchAssessor(self.event).assess()
+        num_queries = len(context.captured_queries)
+
+        participation = EventParticipation.objects.get(pk=self.participation.pk)
+        slots = list(participation.slots.base_slots())
+        self.assertEqual(scores[participation.pk], Decimal("5.00"))
+        with self.assertNumQueries(0):
+            self.assertEqual(participation.score, "5.00")
+            self.assertEqual(
+                sum([s.score for s in slots if s.score is not None]), Decimal("5.00")
+            )
+
+        # results match the ones of the single-slot assessor
+        for slot in slots:
+            batch_score = slot._auto_score
+            slot._auto_score_outdated = True
+            self.assertEqual(slot.score, batch_score)
+
+        # sub-slots are marked as assessed too
+        self.assertFalse(
+            EventParticipationSlot.objects.filter(_auto_score_outdated=True).exists()
+        )
+
+        EventParticipation.objects.create(event_id=self.event.pk, user=self.student_2)
+        # unclaimed participations aren't assessed
+        EventParticipation.objects.create(event_id=self.event.pk)
+        with self.assertNumQueries(num_queries):
+            scores = BatchAssessor(self.event).assess()
+        self.assertEqual(len(scores), 2)
+
+    def test_batch_assessment_after_concurrent_change(self):
+        slot_msc_pk = self.slot_msc.pk
+
+        class Assessor(BatchAssessor):
+            def get_slots(self):
+                slots = list(super().get_slots())
+                # the slot is changed after being loaded
+                EventParticipationSlot.objects.filter(
+                    pk=slot_msc_pk
+                ).mark_scores_outdated()
+                return slots
+
+        Assessor(self.event).assess()
+
+        # the score of the changed slot and of its participation aren't stored
+        outdated_slots = EventParticipationSlot.objects.filter(
+            _auto_score_outdated=True
+        )
+        self.assertListEqual(
+            list(outdated_slots.values_list("pk", flat=True)), [slot_msc_pk]
+        )
+        participation = EventParticipation.objects.get(pk=self.participation.pk)
+        self.assertTrue(participation._auto_score_outdated)
+
     def test_open_answer_assessment(self):
         pass
 
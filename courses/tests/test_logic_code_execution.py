@@ -0,0 +1,491 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from coding import helpers, jobe_c_driver
+from coding.backends import AsyncExecutionBackend
+from coding.helpers import (
+    get_cached_code_execution_results,
+    get_code_execution_cache_key,
+    get_c_testcase_result,
+    get_code_execution_results,
+    run_c_testcases_compiled_once,
+)
+from coding.node_workers import NodeWorkerPool
+from courses.models import (
+    Course,
+    Event,
+    EventParticipation,
+    EventTemplateRule,
+    Exercise,
+    ExerciseTestCase,
+)
+from courses.consumers import get_code_execution_group_name
+from courses.logic.code_execution import (
+    MAX_IN_FLIGHT_RUNS_PER_USER,
+    complete_slot_run,
+    get_slot_run_token_key,
+    is_current_slot_run,
+    is_slot_run_scheduling_enabled,
+    schedule_slot_run,
+)
+from courses.tasks import bulk_run_user_code_task, run_user_code_task
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from users.models import User
+
+from data import users, courses, exercises, events
+
+
+class CodeExecutionCacheTestCase(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(**users.teacher_1)
+        self.course = Course.objects.create(creator=self.teacher, **courses.course_1)
+        self.js = Exercise.objects.create(course=self.course, **exercises.js_prv_1)
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_cache_key(self, code):
+        return get_code_execution_cache_key(self.js, code, self.js.testcases.all())
+
+    def test_cache_key(self):
+        key = self.get_cache_key("abc")
+        self.assertEqual(key, self.get_cache_key("abc"))
+        self.assertNotEqual(key, self.get_cache_key("abcd"))
+
+        # show editing, adding, or removing testcases changes the key
+        testcase = self.js.testcases.first()
+        testcase.code = "000"
+        testcase.save()
+        edited_key = self.get_cache_key("abc")
+        self.assertNotEqual(key, edited_key)
+
+        new_testcase = ExerciseTestCase.objects.create(exercise=self.js, code="111")
+        added_key = self.get_cache_key("abc")
+        self.assertNotEqual(edited_key, added_key)
+
+        new_testcase.delete()
+        self.assertEqual(edited_key, self.get_cache_key("abc"))
+
+        # show the language flags are part of the key
+        self.js.requires_typescript = True
+        self.assertNotEqual(edited_key, self.get_cache_key("abc"))
+
+    def test_cached_results(self):
+        self.assertIsNone(get_cached_code_execution_results(exercise=self.js, code="a"))
+
+        results = {"tests": [], "state": "completed"}
+        cache.set(self.get_cache_key("a"), results)
+
+        # show cached results are returned without running the code
+        self.assertEqual(
+            get_cached_code_execution_results(exercise=self.js, code="a"), results
+        )
+        self.assertEqual(get_code_execution_results(exercise=self.js, code="a"), results)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class BulkCodeExecutionTestCase(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(**users.teacher_1)
+        self.student_1 = User.objects.create(**users.student_1)
+        self.student_2 = User.objects.create(**users.student_2)
+        self.course = Course.objects.create(creator=self.teacher, **courses.course_1)
+        self.js = Exercise.objects.create(course=self.course, **exercises.js_prv_1)
+
+        self.event = Event.objects.create(
+            course=self.course, creator=self.teacher, **events.exam_1_one_at_a_time
+        )
+        rule = EventTemplateRule.objects.create(
+            template=self.event.template,
+            rule_type=EventTemplateRule.ID_BASED,
+            weight=3,
+        )
+        rule.exercises.set([self.js])
+
+        self.slots = []
+        for user, code in ((self.student_1, "right"), (self.student_2, "wrong")):
+            participation = EventParticipation.objects.create(
+                event_id=self.event.pk, user=user
+            )
+            slot = participation.slots.get()
+            slot.answer_text = code
+            slot.save()
+            self.slots.append(slot)
+
+        # results are cached so the code doesn't need to be actually run
+        testcases = self.js.testcases.all()
+        for code, passed in (("right", True), ("wrong", False)):
+            cache.set(
+                get_code_execution_cache_key(self.js, code, testcases),
+                {
+                    "tests": [{"id": t.id, "passed": passed} for t in testcases],
+                    "state": "completed",
+                },
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_bulk_run_event_submissions(self):
+        layer = get_channel_layer()
+        channel_name = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(
+            get_code_execution_group_name("event", self.event.pk), channel_name
+        )
+
+        bulk_run_user_code_task(event_id=str(self.event.pk))
+
+        right_slot, wrong_slot = self.slots
+        right_slot.refresh_from_db()
+        wrong_slot.refresh_from_db()
+        self.assertTrue(all(t["passed"] for t in right_slot.execution_results["tests"]))
+        self.assertEqual(right_slot.score, 3)
+        self.assertEqual(wrong_slot.score, 0)
+        self.assertEqual(right_slot.participation.score, "3.00")
+
+        # show progress is reported to the subscribers of the event
+        message = async_to_sync(layer.receive)(channel_name)
+        self.assertEqual(message["type"], "code_execution_progress")
+        self.assertDictEqual(message["payload"], {"done": 2, "total": 2})
+
+    def test_slot_run_scheduling(self):
+        slot = self.slots[0]
+        user_id = slot.participation.user_id
+
+        # show a newer run of a slot supersedes the queued one without
+        # counting towards the runs in flight of the user
+        tokens = [schedule_slot_run(slot.pk, user_id) for _ in range(5)]
+        self.assertNotIn(None, tokens)
+        self.assertFalse(is_current_slot_run(slot.pk, tokens[0]))
+        self.assertTrue(is_current_slot_run(slot.pk, tokens[-1]))
+
+        # show superseded runs don't release the reservation
+        complete_slot_run(slot.pk, user_id, tokens[0])
+        self.assertTrue(is_current_slot_run(slot.pk, tokens[-1]))
+
+        # show users can't have more than a given number of runs in flight
+        for other_slot_id in range(1000, 1000 + MAX_IN_FLIGHT_RUNS_PER_USER - 1):
+            self.assertIsNotNone(schedule_slot_run(other_slot_id, user_id))
+        self.assertIsNone(schedule_slot_run(2000, user_id))
+
+        # show completing a run allows scheduling a new one
+        complete_slot_run(slot.pk, user_id, tokens[-1])
+        self.assertIsNotNone(schedule_slot_run(2000, user_id))
+
+        # show runs whose token is missing, e.g. because it expired, aren't
+        # considered superseded
+        token = schedule_slot_run(slot.pk, user_id)
+        cache.delete(get_slot_run_token_key(slot.pk))
+        self.assertTrue(is_current_slot_run(slot.pk, token))
+
+    def test_slot_run_released_when_not_queued(self):
+        self.event.state = Event.OPEN
+        self.event.save()
+        slot = self.slots[0]
+        slot.answer_text = "not cached"
+        slot.save()
+
+        client = APIClient()
+        client.force_authenticate(self.student_1)
+        url = (
+            f"/courses/{self.course.pk}/events/{self.event.pk}/participations/"
+            f"{slot.participation_id}/slots/{slot.pk}/run/"
+        )
+        with mock.patch(
+            "courses.views.is_slot_run_scheduling_enabled", return_value=True
+        ), mock.patch.object(
+            run_user_code_task, "apply_async", side_effect=OSError("broker down")
+        ):
+            with self.assertRaises(OSError):
+                client.post(url)
+
+        # show the run that couldn't be queued doesn't count towards the runs
+        # in flight of the user
+        for slot_id in range(1000, 1000 + MAX_IN_FLIGHT_RUNS_PER_USER):
+            self.assertIsNotNone(schedule_slot_run(slot_id, self.student_1.pk))
+
+    def test_slot_run_scheduling_requires_shared_cache(self):
+        # the cache used by tests is local to the process
+        self.assertFalse(is_slot_run_scheduling_enabled())
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                    "LOCATION": "redis://localhost:6379",
+                }
+            }
+        ):
+            self.assertTrue(is_slot_run_scheduling_enabled())
+
+
+# stand-in for coding/worker.js, which needs vm2: it runs the code of each
+# request inside of a vm context, whose microtasks are run by the worker itself,
+# and reports every test case as passed
+FAKE_NODE_WORKER = """
+const readline = require("readline");
+const vm = require("vm");
+
+const send = (message) => process.stdout.write(JSON.stringify(message) + "\\n");
+const requests = readline.createInterface({ input: process.stdin });
+requests.on("line", (line) => {
+  const request = JSON.parse(line);
+  if (request.type === "ping") {
+    send({ id: request.id, type: "pong" });
+    return;
+  }
+  vm.runInNewContext(request.code, {}, { timeout: 1000 });
+  const tests = (request.testcases ?? []).map((t) => ({ id: t.id, passed: true }));
+  if (request.stream) {
+    tests.forEach((test) => send({ id: request.id, type: "progress", test }));
+  }
+  send({ id: request.id, outcome: { tests } });
+});
+requests.on("close", () => process.exit(0));
+"""
+
+
+def write_fake_node_worker():
+    fd, script_path = tempfile.mkstemp(suffix=".js")
+    with os.fdopen(fd, "w") as f:
+        f.write(FAKE_NODE_WORKER)
+    return script_path
+
+
+@unittest.skipIf(shutil.which("node") is None, "node isn't installed")
+class NodeWorkerPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.script_path = write_fake_node_worker()
+        self.pool = NodeWorkerPool(
+            self.script_path, size=1, job_timeout=2, release_check_timeout=0.5
+        )
+
+    def tearDown(self):
+        self.pool.shutdown()
+        os.remove(self.script_path)
+
+    def test_worker_kept_busy_after_job_is_replaced(self):
+        # the response is sent, but the worker is then stuck running microtasks
+        leaking_code = "(function f() { Promise.resolve().then(f) })()"
+        self.assertEqual(self.pool.run({"code": leaking_code}), {"tests": []})
+        self.assertEqual(self.pool.run({"code": "1 + 1"}), {"tests": []})
+
+
+@unittest.skipIf(shutil.which("node") is None, "node isn't installed")
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class AsyncExecutionBackendTestCase(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(**users.teacher_1)
+        self.student = User.objects.create(**users.student_1)
+        self.course = Course.objects.create(creator=self.teacher, **courses.course_1)
+        self.js = Exercise.objects.create(course=self.course, **exercises.js_prv_1)
+        event = Event.objects.create(
+            course=self.course, creator=self.teacher, **events.exam_1_one_at_a_time
+        )
+        rule = EventTemplateRule.objects.create(
+            template=event.template, rule_type=EventTemplateRule.ID_BASED, weight=1
+        )
+        rule.exercises.set([self.js])
+        participation = EventParticipation.objects.create(
+            event_id=event.pk, user=self.student
+        )
+        self.slot = participation.slots.get()
+        self.slot.answer_text = "const a = 1"
+        self.slot.save()
+
+        self.script_path = write_fake_node_worker()
+        self.backend = AsyncExecutionBackend()
+        self.backend.node_worker_path = self.script_path
+
+    def tearDown(self):
+        os.remove(self.script_path)
+        cache.clear()
+
+    def test_run_user_code_task_with_progress(self):
+        layer = get_channel_layer()
+        channel_name = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(
+            "submission_slot_" + str(self.slot.pk), channel_name
+        )
+
+        # progress is reported by the task with `async_to_sync`, which can't be
+        # used inside of the backend's event loop
+        with mock.patch("courses.tasks.channel_layer", layer), mock.patch(
+            "coding.backends._backend", self.backend
+        ):
+            run_user_code_task(self.slot.pk)
+
+        self.slot.refresh_from_db()
+        testcase_ids = [t.id for t in self.js.testcases.all()]
+        self.assertListEqual(
+            [t["id"] for t in self.slot.execution_results["tests"]], testcase_ids
+        )
+
+        for testcase_id in testcase_ids:
+            message = async_to_sync(layer.receive)(channel_name)
+            self.assertEqual(message["type"], "execution.progress")
+            self.assertDictEqual(
+                message["payload"], {"id": testcase_id, "passed": True}
+            )
+        message = async_to_sync(layer.receive)(channel_name)
+        self.assertEqual(message["type"], "execution.results")
+        self.assertEqual(message["payload"], self.slot.execution_results)
+
+    def test_runs_share_event_loop(self):
+        testcases = list(self.js.testcases.all())
+        expected = {
+            "tests": [{"id": t.id, "passed": True} for t in testcases],
+            "state": "completed",
+        }
+        for _ in range(2):
+            self.assertEqual(self.backend.run(self.js, "1 + 1", testcases), expected)
+
+        # show the runs of a process are submitted to the same running loop,
+        # and share the same HTTP client
+        loop, client = self.backend._get_loop()
+        self.assertTrue(loop.is_running())
+        self.assertEqual(self.backend._get_loop(), (loop, client))
+        self.assertEqual(
+            self.backend.run_many(self.js, ["1", "2"], testcases), [expected] * 2
+        )
+
+        # show forked processes start a loop of their own
+        with mock.patch("coding.backends.os.getpid", return_value=-1):
+            self.assertNotEqual(self.backend._get_loop()[0], loop)
+
+
+@unittest.skipIf(shutil.which("gcc") is None, "gcc isn't installed")
+class JobeCDriverTestCase(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.testcase = SimpleNamespace(id=1, pk=1, stdin="", expected_stdout="ok")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_testcase(self, code):
+        executable = os.path.join(self.dir, "prog")
+        subprocess.run(
+            ["gcc", "-x", "c", "-", "-o", executable], input=code, text=True
+        )
+        with mock.patch.object(jobe_c_driver, "EXECUTABLE", executable):
+            response = jobe_c_driver.run_testcase(self.testcase.stdin)
+        return get_c_testcase_result(self.testcase, response)
+
+    def test_testcase_outcomes(self):
+        # show programs killed by a signal get the same outcome they get when
+        # their testcase is run on its own by Jobe
+        result = self.run_testcase('#include <stdio.h>\nint main() { printf("ok"); }')
+        self.assertTrue(result["passed"])
+        self.assertIsNone(result["error"])
+
+        result = self.run_testcase(
+            "#include <signal.h>\nint main() { raise(SIGSEGV); }"
+        )
+        self.assertFalse(result["passed"])
+        self.assertEqual(result["error"], "runtime_error")
+
+        result = self.run_testcase(
+            "#include <signal.h>\nint main() { raise(SIGXCPU); }"
+        )
+        self.assertFalse(result["passed"])
+        self.assertEqual(result["error"], "timeout")
+
+    def test_runs_sized_by_testcases_count(self):
+        testcases = [
+            SimpleNamespace(id=i, pk=i, stdin="", expected_stdout="")
+            for i in range(helpers.JOBE_DRIVER_MAX_TESTCASES * 2 + 1)
+        ]
+        payloads = []
+
+        def post(url, data):
+            payload = json.loads(data)["run_spec"]
+            payloads.append(payload)
+            runs = [
+                {"outcome": jobe_c_driver.OK, "stdout": "", "stderr": ""}
+                for _ in json.loads(payload["input"])
+            ]
+            return mock.Mock(
+                status_code=200,
+                json=lambda: {
+                    "outcome": 15,
+                    "stdout": json.dumps({"outcome": jobe_c_driver.OK, "runs": runs}),
+                },
+            )
+
+        with mock.patch.object(
+            helpers, "upload_file_to_jobe", return_value="file_id"
+        ), mock.patch.object(helpers, "get_jobe_session") as get_jobe_session:
+            get_jobe_session.return_value.post.side_effect = post
+            responses = run_c_testcases_compiled_once("", testcases)
+
+        self.assertEqual(len(responses), len(testcases))
+        self.assertRunsSizedByTestcasesCount(payloads)
+
+    def test_async_runs_sized_by_testcases_count(self):
+        testcases = [
+            SimpleNamespace(id=i, pk=i, stdin="", expected_stdout="")
+            for i in range(helpers.JOBE_DRIVER_MAX_TESTCASES * 2 + 1)
+        ]
+        payloads = []
+        invalid_response = False
+
+        def handle(request):
+            if request.method in ("HEAD", "PUT"):
+                return httpx.Response(204)
+            if invalid_response:
+                return httpx.Response(200, content=b"<html>")
+            payload = json.loads(request.content)["run_spec"]
+            payloads.append(payload)
+            runs = [
+                {"outcome": jobe_c_driver.OK, "stdout": "", "stderr": ""}
+                for _ in json.loads(payload["input"])
+            ]
+            return httpx.Response(
+                200,
+                json={
+                    "outcome": 15,
+                    "stdout": json.dumps({"outcome": jobe_c_driver.OK, "runs": runs}),
+                },
+            )
+
+        async def run():
+            transport = httpx.MockTransport(handle)
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await AsyncExecutionBackend().run_c_compiled_once(
+                    client, "", testcases
+                )
+
+        responses = async_to_sync(run)()
+        self.assertEqual(len(responses), len(testcases))
+        self.assertRunsSizedByTestcasesCount(payloads)
+
+        # responses that aren't valid JSON make the testcases run one by one
+        invalid_response = True
+        with self.assertRaises(helpers.JobeError):
+            async_to_sync(run)()
+
+    def assertRunsSizedByTestcasesCount(self, payloads):
+        # testcases are split across runs whose cpu time fits in Jobe's limit
+        self.assertEqual(len(payloads), 3)
+        for payload in payloads:
+            cputime = payload["parameters"]["cputime"]
+            self.assertLessEqual(cputime, helpers.JOBE_MAX_CPUTIME)
+            self.assertGreaterEqual(
+                cputime,
+                jobe_c_driver.TESTCASE_TIMEOUT * len(json.loads(payload["input"])),
+            )
@@ -1,4 +1,4 @@
-from courses.logic.event_instances import get_exercises_from
+from courses.logic.event_instances import ExercisePoolIndex, get_exercises_from
 from courses.models import (
     Course,
     Event,
@@ -162,6 +162,64 @@ class GetExercisesFromTemplateTestCase(TestCase):
             self.assertIn(exercises[2].pk, [self.e3.pk, self.e4.pk, self.e5.pk])
             self.assertIn(exercises[3].pk, [self.e6.pk])
 
+    def test_satisfying(self):
+        # show ExerciseQuerySet.satisfying and the in-memory index agree on the
+        # exercises satisfying each rule of the template
+        rules = list(
+            self.template.rules.all().prefetch_related("exercises", "clauses__tags")
+        )
+        expected = [
+            {self.e1.pk, self.e2.pk},
+            {self.e1.pk, self.e2.pk, self.e5.pk},
+            {self.e3.pk, self.e4.pk, self.e5.pk},
+            {self.e6.pk},
+        ]
+        pool_index = ExercisePoolIndex(self.template)
+        candidates = pool_index.get_candidates()
+        for rule, expected_pks in zip(rules, expected):
+            # prefetched clauses and tags are reused
+            with self.assertNumQueries(1):
+                pks = set(
+                    Exercise.objects.filter(course=self.course)
+                    .satisfying(rule)
+                    .values_list("pk", flat=True)
+                )
+            self.assertSetEqual(pks, expected_pks)
+            self.assertSetEqual(pool_index.satisfying(rule, candidates), expected_pks)
+
+    def test_get_exercises_from_template_queries(self):
+        # show the rules of a template are resolved with a constant number of
+        # queries, regardless of the number of rules
+
+        # exercise states, public tags, private tags, rules, rules' exercises,
+        # rules' clauses, clauses' tags, and picked exercises
+        with self.assertNumQueries(8):
+            get_exercises_from(self.template)
+
+        for _ in range(0, 5):
+            r = EventTemplateRule.objects.create(
+                template=self.template,
+                rule_type=EventTemplateRule.TAG_BASED,
+                amount=1,
+            )
+            EventTemplateRuleClause.objects.create(rule=r).tags.set([self.tag7])
+
+        with self.assertNumQueries(8):
+            get_exercises_from(self.template)
+
+        # an index can be reused to draw exercises again
+        pool_index = ExercisePoolIndex(self.template)
+        for _ in range(0, 20):
+            with self.assertNumQueries(1):
+                exercises = [
+                    e
+                    for e, _ in get_exercises_from(
+                        self.template, pool_index=pool_index
+                    )
+                ]
+            self.assertIn(exercises[0].pk, [self.e1.pk, self.e2.pk])
+            self.assertEqual(len(exercises), len(set(exercises)))
+
     # def test_integration_with_event_instance_manager(self):
     #     # show passing an EventTemplate to EventInstanceManager generates an
     #     # EventInstance with the correct exercises
@@ -0,0 +1,149 @@
+from asgiref.sync import async_to_sync
+from courses.consumers import PrivilegesCacheMixin
+from courses.logic import privileges
+from courses.logic.privileges import (
+    ASSESS_PARTICIPATIONS,
+    MANAGE_EVENTS,
+    MANAGE_EXERCISES,
+    check_privilege,
+    get_privileges_version,
+    get_user_privileges,
+    privileges_cache,
+)
+from courses.models import Course, CourseRole, UserCoursePrivilege
+from django.test import TestCase
+from users.models import User
+
+from data import users, courses
+
+
+class PrivilegesLogicTestCase(TestCase):
+    def setUp(self):
+        self.teacher_1 = User.objects.create(**users.teacher_1)
+        self.teacher_2 = User.objects.create(**users.teacher_2)
+        self.course = Course.objects.create(creator=self.teacher_1, **courses.course_1)
+        UserCoursePrivilege.objects.create(
+            user=self.teacher_2,
+            course=self.course,
+            allow_privileges=[MANAGE_EVENTS, MANAGE_EXERCISES],
+            deny_privileges=[MANAGE_EXERCISES],
+        )
+
+    def test_privileges(self):
+        self.assertTrue(check_privilege(self.teacher_1, self.course, MANAGE_EVENTS))
+        self.assertTrue(check_privilege(self.teacher_2, self.course, MANAGE_EVENTS))
+        self.assertFalse(
+            check_privilege(self.teacher_2, self.course.pk, MANAGE_EXERCISES)
+        )
+        self.assertFalse(
+            check_privilege(self.teacher_2, self.course.pk, ASSESS_PARTICIPATIONS)
+        )
+        self.assertTrue(check_privilege(self.teacher_2, self.course.pk, "__some__"))
+        self.assertListEqual(
+            get_user_privileges(self.teacher_2, self.course.pk), [MANAGE_EVENTS]
+        )
+
+    def test_privileges_cache(self):
+        # show privileges are resolved once per user and course, and then
+        # reused within a privileges_cache block
+        with privileges_cache():
+            # course, roles, and per-user privileges
+            with self.assertNumQueries(3):
+                self.assertTrue(
+                    check_privilege(self.teacher_2, self.course.pk, MANAGE_EVENTS)
+                )
+            with self.assertNumQueries(0):
+                self.assertFalse(
+                    check_privilege(self.teacher_2, self.course, MANAGE_EXERCISES)
+                )
+                self.assertListEqual(
+                    get_user_privileges(self.teacher_2, str(self.course.pk)),
+                    [MANAGE_EVENTS],
+                )
+
+        # privileges are shared across requests until they change
+        with self.assertNumQueries(0):
+            check_privilege(self.teacher_2, self.course.pk, MANAGE_EVENTS)
+
+        privilege = UserCoursePrivilege.objects.get(user=self.teacher_2)
+        privilege.deny_privileges = [MANAGE_EVENTS]
+        privilege.save()
+        self.assertFalse(check_privilege(self.teacher_2, self.course, MANAGE_EVENTS))
+
+        role = CourseRole.objects.create(
+            course=self.course, name="role", allow_privileges=[ASSESS_PARTICIPATIONS]
+        )
+        self.assertFalse(
+            check_privilege(self.teacher_2, self.course, ASSESS_PARTICIPATIONS)
+        )
+        self.teacher_2.roles.add(role)
+        self.assertTrue(
+            check_privilege(self.teacher_2, self.course, ASSESS_PARTICIPATIONS)
+        )
+        self.teacher_2.roles.clear()
+        self.assertFalse(
+            check_privilege(self.teacher_2, self.course, ASSESS_PARTICIPATIONS)
+        )
+
+        # changing the creator of the course changes their privileges
+        self.assertFalse(check_privilege(self.teacher_2, self.course, MANAGE_EVENTS))
+        self.course.creator = self.teacher_2
+        self.course.save()
+        self.assertTrue(check_privilege(self.teacher_2, self.course, MANAGE_EVENTS))
+
+    def test_privileges_invalidated_on_commit(self):
+        # show cached privileges are invalidated again once the changes are
+        # committed, as privileges computed from the old data by other processes
+        # can have been cached in the meantime
+        privilege = UserCoursePrivilege.objects.get(user=self.teacher_2)
+        role = CourseRole.objects.create(
+            course=self.course, name="role", allow_privileges=[MANAGE_EVENTS]
+        )
+
+        def update_privilege():
+            privilege.allow_privileges = [MANAGE_EVENTS, ASSESS_PARTICIPATIONS]
+            privilege.save()
+
+        def update_course():
+            self.course.creator = self.teacher_2
+            self.course.save()
+
+        for change in [
+            update_privilege,
+            lambda: role.save(),
+            lambda: self.teacher_2.roles.add(role),
+            lambda: self.teacher_2.roles.clear(),
+            lambda: role.delete(),
+            lambda: privilege.delete(),
+            update_course,
+        ]:
+            with self.captureOnCommitCallbacks() as callbacks:
+                change()
+            self.assertGreater(len(callbacks), 0)
+
+            version = get_privileges_version(self.course.pk)
+            for callback in callbacks:
+                callback()
+            self.assertNotEqual(get_privileges_version(self.course.pk), version)
+
+    def test_privileges_cache_per_consumer_message(self):
+        # show privileges are memoized while handling each message received by
+        # a consumer, and not across messages
+        memos = []
+
+        class BaseConsumer:
+            async def dispatch(self, message):
+                memos.append(privileges._privileges_cache.get())
+
+        class Consumer(PrivilegesCacheMixin, BaseConsumer):
+            pass
+
+        consumer = Consumer()
+        for _ in range(2):
+            async_to_sync(consumer.dispatch)({"type": "websocket.receive"})
+
+        self.assertEqual(len(memos), 2)
+        self.assertIsNotNone(memos[0])
+        self.assertIsNotNone(memos[1])
+        self.assertIsNot(memos[0], memos[1])
+        self.assertIsNone(privileges._privileges_cache.get())
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from courses.models import (
     Course,
     Event,
@@ -8,8 +10,9 @@ from courses.models import (
     Exercise,
     Tag,
 )
+from courses.tasks import create_participation_pool_task
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from users.models import User
 
 
@@ -687,3 +690,113 @@ class EventParticipationManagerTestCase(TestCase):
 
             self.assertNotEqual(slot_0.exercise.pk, slot_1.exercise.pk)
             self.assertNotEqual(slot_1.exercise.pk, slot_2.exercise.pk)
+
+    def test_creation_with_given_exercises(self):
+        exercises_with_rules = [
+            (self.e1, None),
+            (self.e4, None),
+            (self.e3, None),
+        ]
+
+        # the whole tree of slots is created with a number of queries
+        # that doesn't depend on the number of exercises
+        with self.assertNumQueries(5):
+            participation = EventParticipation.objects.create(
+                event_id=self.event.pk,
+                user=self.user,
+                exercises=exercises_with_rules,
+            )
+
+        base_slots = participation.slots.base_slots()
+        self.assertListEqual(
+            [s.exercise.pk for s in base_slots],
+            [self.e1.pk, self.e4.pk, self.e3.pk],
+        )
+        self.assertListEqual([s.slot_number for s in base_slots], [0, 1, 2])
+
+        # only the first slot is marked as seen
+        self.assertIsNotNone(base_slots[0].seen_at)
+        self.assertIsNone(base_slots[1].seen_at)
+
+        # sub-slots reference the sub-exercises in order
+        aggregated_slot = base_slots[1]
+        self.assertListEqual(
+            [(s.slot_number, s.exercise.pk) for s in aggregated_slot.sub_slots.all()],
+            [(i, e.pk) for i, e in enumerate(self.e4.sub_exercises.all())],
+        )
+        self.assertEqual(participation.slots.count(), 5)
+
+    def test_participation_pool(self):
+        user_2 = User.objects.create(email="ccc@bbb.com", username="ccc")
+
+        pool = EventParticipation.objects.create_pool(self.event, 2)
+        self.assertEqual(len(pool), 2)
+
+        # pre-generated participations aren't assigned to anyone
+        self.assertEqual(self.event.participations.unassigned().count(), 2)
+        self.assertFalse(self.event.participations.assigned().exists())
+        for participation in pool:
+            self.assertEqual(participation.slots.base_slots().count(), 4)
+
+        """
+        Show users claim the pre-generated participations
+        """
+        claimed_pk = EventParticipation.objects.claim(self.event.pk, self.user)
+        self.assertIn(claimed_pk, [p.pk for p in pool])
+
+        claimed = EventParticipation.objects.get(pk=claimed_pk)
+        self.assertEqual(claimed.user, self.user)
+        self.assertIsNotNone(claimed.slots.base_slots().get(slot_number=0).seen_at)
+        self.assertEqual(self.event.participations.unassigned().count(), 1)
+
+        other_claimed_pk = EventParticipation.objects.claim(self.event.pk, user_2)
+        self.assertNotEqual(claimed_pk, other_claimed_pk)
+        self.assertEqual(
+            EventParticipation.objects.get(pk=other_claimed_pk).user, user_2
+        )
+
+        # pool is exhausted
+        self.assertIsNone(EventParticipation.objects.claim(self.event.pk, self.user))
+        self.assertEqual(self.event.participations.assigned().count(), 2)
+
+    @override_settings(
+        CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    )
+    def test_participation_pool_follows_template(self):
+        # run the generation of pools synchronously once the changes are committed
+        def apply_changes(change):
+            with mock.patch.object(
+                create_participation_pool_task, "delay", create_participation_pool_task
+            ), self.captureOnCommitCallbacks(execute=True):
+                change()
+
+        def plan_event():
+            self.event.state = Event.PLANNED
+            self.event.participation_pool_size = 2
+            self.event.save()
+
+        apply_changes(plan_event)
+        old_pks = set(self.event.participations.values_list("pk", flat=True))
+        self.assertEqual(len(old_pks), 2)
+
+        # editing a rule of a planned event discards the pool and generates it again
+        rule = self.template.rules.first()
+        apply_changes(lambda: rule.exercises.set([self.e7]))
+        self.assertEqual(self.event.participations.unassigned().count(), 2)
+        self.assertFalse(self.event.participations.filter(pk__in=old_pks).exists())
+
+        claimed_pk = EventParticipation.objects.claim(self.event.pk, self.user)
+        claimed = EventParticipation.objects.get(pk=claimed_pk)
+        self.assertEqual(
+            claimed.slots.base_slots().get(populating_rule=rule).exercise, self.e7
+        )
+
+        # the same happens when the size of the pool changes
+        def resize_pool():
+            self.event.participation_pool_size = 3
+            self.event.save()
+
+        apply_changes(resize_pool)
+        self.assertEqual(self.event.participations.unassigned().count(), 3)
+        # claimed participations are kept
+        self.assertTrue(self.event.participations.filter(pk=claimed_pk).exists())
@@ -173,6 +173,64 @@ class ModelPropertiesTestCase(TestCase):
         #     ],
         # )
 
+    def test_exercise_max_score(self):
+        # max score is stored on the exercise and kept up to date
+        self.assertEqual(self.e_multiple_single.get_max_score(), Decimal("1.00"))
+        self.assertEqual(self.e_multiple_multiple.get_max_score(), Decimal("1.50"))
+        self.assertEqual(self.e_js.get_max_score(), 2)
+        self.assertIsNone(self.e_open.get_max_score())
+
+        exercise = Exercise.objects.get(pk=self.e_multiple_multiple.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(exercise.get_max_score(), Decimal("1.50"))
+
+        # changes to choices are reflected on the max score
+        choice = exercise.choices.get(text="bb")
+        choice.correctness = "2"
+        choice.save()
+        self.assertEqual(
+            Exercise.objects.get(pk=exercise.pk).get_max_score(), Decimal("3.50")
+        )
+        choice.delete()
+        self.assertEqual(
+            Exercise.objects.get(pk=exercise.pk).get_max_score(), Decimal("1.50")
+        )
+
+        self.e_js.testcases.first().delete()
+        self.assertEqual(Exercise.objects.get(pk=self.e_js.pk).get_max_score(), 1)
+
+        # changes to sub-exercises propagate up the parent chain
+        aggregated = Exercise.objects.get(pk=self.e_aggregated.pk)
+        self.assertEqual(aggregated.get_max_score(), 0)
+        sub_exercise = aggregated.sub_exercises.first()
+        sub_choice = sub_exercise.choices.first()
+        sub_choice.correctness = "2"
+        sub_choice.save()
+        self.assertEqual(
+            Exercise.objects.get(pk=aggregated.pk).get_max_score(), Decimal("2.00")
+        )
+
+        sub_exercise.child_weight = 3
+        sub_exercise.save()
+        self.assertEqual(
+            Exercise.objects.get(pk=aggregated.pk).get_max_score(), Decimal("6.00")
+        )
+
+        Exercise.objects.create(
+            course=self.course,
+            parent=aggregated,
+            exercise_type=Exercise.MULTIPLE_CHOICE_SINGLE_POSSIBLE,
+            choices=[{"text": "a", "correctness": "1"}],
+        )
+        self.assertEqual(
+            Exercise.objects.get(pk=aggregated.pk).get_max_score(), Decimal("7.00")
+        )
+
+        sub_exercise.delete()
+        self.assertEqual(
+            Exercise.objects.get(pk=aggregated.pk).get_max_score(), Decimal("1.00")
+        )
+
     def test_events(self):
         e1 = Event.objects.create(
             course=self.course, name="test_event_1", event_type=Event.DRAFT
@@ -193,6 +251,60 @@ class ModelPropertiesTestCase(TestCase):
             e1.access_rule_exceptions = ["abc", True]
             e1.save()
 
+    def test_event_state(self):
+        now = timezone.localtime(timezone.now())
+        event = Event.objects.create(
+            course=self.course,
+            name="test_event_2",
+            event_type=Event.EXAM,
+            begin_timestamp=now - timezone.timedelta(minutes=1),
+            end_timestamp=now + timezone.timedelta(minutes=1),
+            close_automatically=True,
+        )
+        event.state = Event.PLANNED
+        event.save()
+
+        # reading the state doesn't query or write to the db
+        event = Event.objects.get(pk=event.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(event.state, Event.OPEN)
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.PLANNED)
+
+        # transitions are persisted by update_states
+        Event.objects.update_states()
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.OPEN)
+
+        Event.objects.filter(pk=event.pk).update(end_timestamp=now)
+        Event.objects.update_states()
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.CLOSED)
+
+        # restricted events with no users allowed past closure are closed as
+        # soon as they're saved
+        event = Event.objects.get(pk=event.pk)
+        event.state = Event.RESTRICTED
+        event.save()
+        self.assertEqual(event.state, Event.CLOSED)
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.CLOSED)
+
+        # restricted events are re-opened when all participants are allowed
+        user_2 = User.objects.create(username="user_2", email="user_2@bbb.com")
+        EventParticipation.objects.create(user=self.user, event_id=event.pk)
+        EventParticipation.objects.create(user=user_2, event_id=event.pk)
+        event.users_allowed_past_closure.add(self.user)
+        event.state = Event.RESTRICTED
+        event.save()
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.RESTRICTED)
+
+        event.users_allowed_past_closure.add(user_2)
+        self.assertEqual(event._event_state, Event.OPEN)
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.OPEN)
+
+        # or as soon as they're saved, if all participants are already allowed
+        event.state = Event.RESTRICTED
+        event.save()
+        self.assertEqual(event._event_state, Event.OPEN)
+        self.assertEqual(Event.objects.get(pk=event.pk)._event_state, Event.OPEN)
+
     def test_participation_current_exercise_property(self):
         pass
 
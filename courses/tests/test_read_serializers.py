@@ -0,0 +1,314 @@
+import itertools
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from courses.logic.exercise_fragments import get_exercise_fragment, serialize_exercise
+from courses.logic.presentation import (
+    EVENT_PARTICIPATION_SHOW_EVENT,
+    EVENT_PARTICIPATION_SHOW_SCORE,
+    EVENT_PARTICIPATION_SHOW_SLOTS,
+    EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS,
+    EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE,
+    EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS,
+    EXERCISE_SHOW_HIDDEN_FIELDS,
+    EXERCISE_SHOW_SOLUTION_FIELDS,
+)
+from courses.models import (
+    Course,
+    Event,
+    EventParticipation,
+    EventParticipationSlot,
+    EventTemplateRule,
+    Exercise,
+    ExerciseTestCase,
+    Tag,
+)
+from courses.read_serializers import (
+    serialize_event_participation,
+    serialize_event_participation_slot,
+)
+from courses.serializers import (
+    EventParticipationSerializer,
+    EventParticipationSlotSerializer,
+    ExerciseSerializer,
+)
+from courses.views import EventParticipationViewSet
+from data import users, courses, exercises, events
+from users.models import User
+
+
+def get_contexts(*flags):
+    """
+    Returns a context for each combination of values of the given flags
+    """
+    for values in itertools.product([False, True], repeat=len(flags)):
+        yield dict(zip(flags, values))
+
+
+class ReadSerializersParityTestCase(TestCase):
+    def setUp(self):
+        self.teacher_1 = User.objects.create(**users.teacher_1)
+        self.student_1 = User.objects.create(**users.student_1)
+        self.course = Course.objects.create(creator=self.teacher_1, **courses.course_1)
+
+        self.event = Event.objects.create(
+            course=self.course, creator=self.teacher_1, **events.exam_1_one_at_a_time
+        )
+        for exercise_data in [
+            exercises.mmc_priv_1,
+            exercises.msc_priv_1,
+            exercises.cloze_prv_1,
+            exercises.open_priv_1,
+            exercises.js_prv_1,
+        ]:
+            exercise = Exercise.objects.create(course=self.course, **exercise_data)
+            rule = EventTemplateRule.objects.create(
+                template=self.event.template,
+                rule_type=EventTemplateRule.ID_BASED,
+                weight=2,
+            )
+            rule.exercises.set([exercise])
+
+        # exercise fields that are rendered differently depending on the context
+        Exercise.objects.update(locked_by=self.teacher_1, solution="solution")
+        for testcase, testcase_type in zip(
+            ExerciseTestCase.objects.all(),
+            itertools.cycle(
+                [
+                    ExerciseTestCase.SHOW_CODE_SHOW_TEXT,
+                    ExerciseTestCase.SHOW_TEXT_ONLY,
+                    ExerciseTestCase.HIDDEN,
+                ]
+            ),
+        ):
+            testcase.testcase_type = testcase_type
+            testcase.text = "text"
+            testcase.save()
+
+        self.event.state = Event.PLANNED
+        self.event.begin_timestamp = timezone.localdate(timezone.now())
+        self.event.save()
+
+        participation = EventParticipation.objects.create(
+            user=self.student_1, event_id=self.event.pk
+        )
+        for slot in EventParticipationSlot.objects.filter(
+            participation=participation
+        ).select_related("exercise"):
+            if slot.exercise.exercise_type in [
+                Exercise.MULTIPLE_CHOICE_MULTIPLE_POSSIBLE,
+                Exercise.MULTIPLE_CHOICE_SINGLE_POSSIBLE,
+            ]:
+                slot.selected_choices.set(slot.exercise.choices.all()[:1])
+            elif slot.exercise.exercise_type == Exercise.OPEN_ANSWER:
+                slot.answer_text = '<p style="color: red">abc <img src="a.png"></p>'
+                slot.score = 1.5
+                slot.comment = "comment"
+                slot.save()
+        self.participation_pk = participation.pk
+
+        request = RequestFactory().get("/")
+        request.user = self.teacher_1
+        self.request = request
+
+    def get_participation(self):
+        return (
+            EventParticipation.objects.all()
+            .with_prefetched_base_slots()
+            .select_related("user", "event")
+            .get(pk=self.participation_pk)
+        )
+
+    def get_slots(self):
+        return (
+            EventParticipationSlot.objects.filter(
+                participation_id=self.participation_pk
+            )
+            .select_related("participation", "exercise", "populating_rule")
+            .order_by("pk")
+        )
+
+    def assertRenderedEqual(self, data, expected):
+        # the serializers' data is compared once rendered, as it can contain
+        # values of different types that are rendered the same way
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_exercise_parity(self):
+        for exercise in Exercise.objects.all():
+            for context in get_contexts(
+                EXERCISE_SHOW_HIDDEN_FIELDS,
+                EXERCISE_SHOW_SOLUTION_FIELDS,
+                "show_choices",
+                "show_testcases",
+            ):
+                self.assertRenderedEqual(
+                    serialize_exercise(exercise, context),
+                    ExerciseSerializer(exercise, context=context).data,
+                )
+
+    def test_slot_parity(self):
+        # sub-slots don't have a populating rule, and therefore a weight
+        self.assertTrue(any(s.parent_id is not None for s in self.get_slots()))
+
+        for context in get_contexts(
+            EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS,
+            EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE,
+            EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS,
+            "assessment_fields_read",
+            "submission_fields_read",
+            "trim_images_in_text",
+        ):
+            context["capabilities"] = {
+                "assessment_fields_read": context.pop("assessment_fields_read"),
+                "assessment_fields_write": False,
+                "submission_fields_read": context.pop("submission_fields_read"),
+            }
+            for slot in self.get_slots():
+                self.assertRenderedEqual(
+                    serialize_event_participation_slot(slot, context),
+                    EventParticipationSlotSerializer(slot, context=context).data,
+                )
+
+    def test_participation_parity(self):
+        for context in get_contexts(
+            EVENT_PARTICIPATION_SHOW_SLOTS,
+            EVENT_PARTICIPATION_SHOW_SCORE,
+            EVENT_PARTICIPATION_SHOW_EVENT,
+            EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS,
+            "assessment_fields_read",
+            "submission_fields_read",
+        ):
+            context.update(
+                {
+                    EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE: True,
+                    EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS: True,
+                    "request": self.request,
+                    "capabilities": {
+                        "assessment_fields_read": context.pop(
+                            "assessment_fields_read"
+                        ),
+                        "assessment_fields_write": True,
+                        "submission_fields_read": context.pop(
+                            "submission_fields_read"
+                        ),
+                    },
+                }
+            )
+            self.assertRenderedEqual(
+                serialize_event_participation(self.get_participation(), context),
+                EventParticipationSerializer(
+                    self.get_participation(), context=context
+                ).data,
+            )
+
+    def test_view_parity(self):
+        client = APIClient()
+        url = f"/courses/{self.course.pk}/events/{self.event.pk}/participations/{self.participation_pk}/"
+
+        def get_responses():
+            ret = []
+            for user in [self.student_1, self.teacher_1]:
+                client.force_authenticate(user)
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                ret.append(response.content)
+            client.force_authenticate(self.student_1)
+            for action in ["go_forward", "go_back"]:
+                response = client.post(url + action + "/")
+                self.assertEqual(response.status_code, 200)
+                ret.append(response.content)
+            return ret
+
+        # the slots are seen, and their seen_at timestamp set, the first time
+        get_responses()
+
+        responses = get_responses()
+        with mock.patch.object(
+            EventParticipationViewSet, "use_read_serializers", False
+        ):
+            self.assertListEqual(responses, get_responses())
+
+
+class ExerciseFragmentCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher_1 = User.objects.create(**users.teacher_1)
+        self.course = Course.objects.create(creator=self.teacher_1, **courses.course_1)
+        self.exercise = Exercise.objects.create(
+            course=self.course, **exercises.cloze_prv_1
+        )
+        self.context = {
+            EXERCISE_SHOW_HIDDEN_FIELDS: True,
+            EXERCISE_SHOW_SOLUTION_FIELDS: True,
+        }
+
+    def get_fragment(self):
+        self.exercise.refresh_from_db()
+        return get_exercise_fragment(self.exercise, self.context)
+
+    def assertFragmentUpToDate(self):
+        self.assertEqual(
+            self.get_fragment(), serialize_exercise(self.exercise, self.context)
+        )
+
+    def test_fragment_is_cached(self):
+        fragment = self.get_fragment()
+
+        # changes that don't go through the models aren't picked up
+        Exercise.objects.filter(pk=self.exercise.pk).update(text="abc")
+        self.assertEqual(self.get_fragment(), fragment)
+
+        # fragments are cached for each combination of flags
+        self.context[EXERCISE_SHOW_SOLUTION_FIELDS] = False
+        self.assertFragmentUpToDate()
+        self.assertEqual(self.get_fragment()["text"], "abc")
+
+    def test_fragment_invalidation(self):
+        sub_exercise = self.exercise.sub_exercises.first()
+        choice = sub_exercise.choices.first()
+        tag = Tag.objects.create(course=self.course, name="tag")
+
+        def update_exercise():
+            self.exercise.text = "abc"
+            self.exercise.save()
+
+        def update_choice():
+            choice.correctness = 0.25
+            choice.save()
+
+        def update_sub_exercise():
+            sub_exercise.child_weight = 3
+            sub_exercise.save()
+
+        def rename_tag():
+            tag.name = "renamed"
+            tag.save()
+
+        for change in [
+            update_exercise,
+            update_choice,
+            lambda: sub_exercise.choices.create(text="new", correctness=1),
+            lambda: sub_exercise.choices.last().delete(),
+            lambda: self.exercise.testcases.create(code="abc"),
+            update_sub_exercise,
+            lambda: Exercise.objects.create(
+                course=self.course,
+                parent=self.exercise,
+                exercise_type=Exercise.OPEN_ANSWER,
+            ),
+            lambda: sub_exercise.public_tags.add(tag),
+            rename_tag,
+            lambda: tag.public_in_exercises.clear(),
+            lambda: self.exercise.private_tags.add(tag),
+            lambda: self.exercise.lock(self.teacher_1),
+            lambda: tag.delete(),
+        ]:
+            # populate the cache before each change
+            self.get_fragment()
+            change()
+            self.assertFragmentUpToDate()
@@ -1,6 +1,7 @@
 from decimal import Decimal
 from django.utils import timezone
 from courses.logic import privileges
+from courses.logic.assessment import BatchAssessor
 from courses.models import (
     Course,
     Event,
@@ -11,6 +12,7 @@ from courses.models import (
     UserCoursePrivilege,
 )
 from django.test import TestCase
+from unittest import mock
 from rest_framework.test import APIClient, force_authenticate
 from users.models import User
 
@@ -906,6 +908,168 @@ class EventParticipationViewSetTestCase(BaseTestCase):
         pass
 
 
+class EventParticipationAssessmentGridTestCase(BaseTestCase):
+    def setUp(self):
+        from data import users, courses, exercises, events
+
+        self.teacher_1 = User.objects.create(**users.teacher_1)
+        self.course = Course.objects.create(creator=self.teacher_1, **courses.course_1)
+
+        self.event = Event.objects.create(
+            course=self.course, creator=self.teacher_1, **events.exam_1_one_at_a_time
+        )
+        for exercise_data in [
+            exercises.mmc_priv_1,
+            exercises.msc_priv_1,
+            exercises.cloze_prv_1,
+            exercises.open_priv_1,
+        ]:
+            exercise = Exercise.objects.create(course=self.course, **exercise_data)
+            rule = EventTemplateRule.objects.create(
+                template=self.event.template,
+                rule_type=EventTemplateRule.ID_BASED,
+                weight=2,
+            )
+            rule.exercises.set([exercise])
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher_1)
+        self.url = f"/courses/{self.course.pk}/events/{self.event.pk}/participations/?include_details=1"
+        self.participations_count = 0
+
+    def add_participations(self, amount):
+        for _ in range(amount):
+            self.participations_count += 1
+            user = User.objects.create(
+                username=f"student{self.participations_count}",
+                email=f"student{self.participations_count}@studenti.unipi.it",
+            )
+            EventParticipation.objects.create(user=user, event_id=self.event.pk)
+
+    def get_participations(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), self.participations_count)
+        return response.data
+
+    def test_list_query_count_does_not_depend_on_participations(self):
+        # participations, base slots, sub-slots, and their exercises and related
+        # objects are each loaded with a single query, plus a savepoint and its
+        # release for the request's transaction. Outdated scores are computed
+        # in bulk, with a fixed number of queries, before serializing them
+        queries_budget = 43
+
+        # the privileges of the user are resolved and cached by the first request
+        self.get_participations()
+
+        for amount in [2, 4]:
+            self.add_participations(amount)
+            # the scores of all participations, and the max scores of the
+            # exercises, need to be computed again
+            EventParticipationSlot.objects.all().mark_scores_outdated()
+            Exercise.objects.update(_max_score_outdated=True)
+
+            with self.assertNumQueries(queries_budget):
+                participations = self.get_participations()
+
+            slots = participations[0]["slots"]
+            self.assertEqual(len(slots), 4)
+            self.assertIn("exercise", slots[0])
+            self.assertIn("has_answer", slots[0])
+            self.assertEqual(Decimal(slots[0]["weight"]), Decimal(2))
+            self.assertTrue(any(len(s["sub_slots"]) > 0 for s in slots))
+
+    def test_list_assesses_outdated_participations_in_bulk(self):
+        self.add_participations(3)
+        # pre-generated participations that haven't been claimed aren't assessed
+        unassigned = EventParticipation.objects.create(event_id=self.event.pk)
+        for slot in EventParticipationSlot.objects.filter(
+            participation__user__isnull=False,
+            exercise__exercise_type=Exercise.MULTIPLE_CHOICE_SINGLE_POSSIBLE,
+        ).select_related("exercise"):
+            slot.selected_choices.set(slot.exercise.choices.filter(correctness__gt=0))
+
+        slots = EventParticipationSlot.objects.filter(
+            participation__event_id=self.event.pk
+        )
+        slots.mark_scores_outdated()
+
+        with mock.patch(
+            "courses.views.BatchAssessor", wraps=BatchAssessor
+        ) as batch_assessor:
+            participations = self.get_participations()
+            # scores are only computed again once they're outdated
+            self.get_participations()
+        batch_assessor.assert_called_once()
+
+        assigned_slots = slots.filter(participation__user__isnull=False)
+        self.assertFalse(assigned_slots.filter(_auto_score_outdated=True).exists())
+        self.assertTrue(assigned_slots.filter(parent__isnull=False).exists())
+        self.assertFalse(
+            slots.filter(participation=unassigned, _auto_score_outdated=False).exists()
+        )
+        self.assertFalse(
+            EventParticipation.objects.filter(
+                event_id=self.event.pk, user__isnull=False, _auto_score_outdated=True
+            ).exists()
+        )
+
+        # the stored scores are the same the slots get when assessed on their own
+        for participation in participations:
+            for slot_data in participation["slots"]:
+                slot = EventParticipationSlot.objects.get(pk=slot_data["id"])
+                score = slot._auto_score
+                self.assertEqual(
+                    slot_data["score"], None if score is None else str(score)
+                )
+                slot.mark_score_outdated()
+                self.assertEqual(slot.score, score)
+
+    def test_normalized_list(self):
+        self.add_participations(3)
+        participations = self.get_participations()
+
+        response = self.client.get(self.url + "&normalized=1")
+        self.assertEqual(response.status_code, 200)
+        normalized_participations = response.data["participations"]
+        exercises = response.data["exercises"]
+
+        # each exercise is included once, and sub-exercises are only included
+        # in their parent exercise
+        exercise_ids = set(
+            Exercise.objects.base_exercises().values_list("pk", flat=True)
+        )
+        self.assertSetEqual(set(exercises.keys()), exercise_ids)
+
+        # slots reference the same exercises as the non-normalized response: the
+        # exercises of sub-slots are found among the sub-exercises of their parent
+        def check_slots(slots, normalized_slots, exercises):
+            self.assertEqual(len(slots), len(normalized_slots))
+            for slot, normalized_slot in zip(slots, normalized_slots):
+                exercise = exercises[normalized_slot["exercise"]]
+                self.assertEqual(slot["exercise"], exercise)
+                check_slots(
+                    slot["sub_slots"],
+                    normalized_slot["sub_slots"],
+                    {e["id"]: e for e in exercise["sub_exercises"]},
+                )
+
+        self.assertEqual(len(participations), len(normalized_participations))
+        for participation, normalized_participation in zip(
+            participations, normalized_participations
+        ):
+            self.assertEqual(participation["id"], normalized_participation["id"])
+            check_slots(
+                participation["slots"], normalized_participation["slots"], exercises
+            )
+
+        # the flag can be turned off
+        for value in ["0", "false"]:
+            response = self.client.get(self.url + "&normalized=" + value)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, participations)
+
+
 class BulkActionsMixinsTestCase(BaseTestCase):
     def setUp(self):
         from data import users, courses, exercises, events
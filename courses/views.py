@@ -16,14 +16,27 @@ from django.shortcuts import get_object_or_404
 from rest_framework import filters, mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from coding.helpers import get_code_execution_results
-from courses.logic.event_instances import get_exercises_from
+from coding.helpers import (
+    get_cached_code_execution_results,
+    get_code_execution_results,
+)
+from courses.logic.assessment import BatchAssessor
+from courses.logic.code_execution import (
+    complete_slot_run,
+    get_code_execution_priority,
+    get_code_execution_queue,
+    is_slot_run_scheduling_enabled,
+    schedule_slot_run,
+)
+from courses.logic.event_instances import ExercisePoolIndex, get_exercises_from
+from courses.logic.participations import share_participation_with_sub_slots
 from courses.logic.presentation import (
     CHOICE_SHOW_SCORE_FIELDS,
     COURSE_SHOW_PUBLIC_EXERCISES_COUNT,
     EVENT_PARTICIPATION_SHOW_EVENT,
     EVENT_PARTICIPATION_SHOW_SCORE,
     EVENT_PARTICIPATION_SHOW_SLOTS,
+    EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES,
     EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS,
     EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE,
     EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS,
@@ -36,12 +49,17 @@ from courses.logic.presentation import (
     TAG_SHOW_PUBLIC_EXERCISES_COUNT,
     TESTCASE_SHOW_HIDDEN_FIELDS,
 )
-from courses.tasks import run_user_code_task
+from courses.tasks import bulk_run_user_code_task, run_user_code_task
 from users.models import User
 from users.serializers import UserSerializer
 from django.http import FileResponse, Http404
 from courses import policies
 from courses.logic import privileges
+from courses.logic.exercise_fragments import get_exercise_fragments
+from courses.read_serializers import (
+    serialize_event_participation,
+    serialize_event_participation_slot,
+)
 from courses.logic.privileges import (
     ASSESS_PARTICIPATIONS,
     MANAGE_EVENTS,
@@ -228,7 +246,7 @@ class CourseViewSet(viewsets.ModelViewSet):
         except KeyError:
             return Response(status=status.HTTP_404_BAD_REQUEST)
 
-        _, created = UserCoursePrivilege.create_or_update(
+        _, created = UserCoursePrivilege.objects.update_or_create(
             user=user,
             course=course,
             defaults={
@@ -408,6 +426,13 @@ class ExerciseViewSet(
         )
         return Response(results)
 
+    @action(detail=True, methods=["post"])
+    def rerun_submissions(self, request, **kwargs):
+        # schedule execution of all the submissions to the exercise
+        exercise = self.get_object()
+        bulk_run_user_code_task.delay(exercise_id=exercise.pk)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
 
 class ExerciseChoiceViewSet(viewsets.ModelViewSet):
     serializer_class = ExerciseChoiceSerializer
@@ -534,16 +559,29 @@ class EventViewSet(ScopeQuerySetByCourseMixin, RequestingUserPrivilegesMixin):
             creator=self.request.user,
         )
 
+    @action(methods=["post"], detail=True)
+    def rerun_submissions(self, request, **kwargs):
+        # schedule execution of all the coding submissions to the event
+        event = self.get_object()
+        bulk_run_user_code_task.delay(event_id=str(event.pk))
+        return Response(status=status.HTTP_202_ACCEPTED)
+
     @action(methods=["get"], detail=True)
     def instances(self, request, **kwargs):
         instance_count = self.request.query_params.get("amount") or 5
 
         data = []
         template = self.get_object().template
+        pool_index = ExercisePoolIndex(template)
         for _ in range(0, int(instance_count)):
             data.append(
                 ExerciseSerializer(
-                    [e for e, _ in get_exercises_from(template)],
+                    [
+                        e
+                        for e, _ in get_exercises_from(
+                            template, pool_index=pool_index
+                        )
+                    ],
                     many=True,
                 ).data
                 # TODO? context to exercise serializer?
@@ -567,7 +605,11 @@ class EventTemplateViewSet(ScopeQuerySetByCourseMixin):
 
 class EventTemplateRuleViewSet(viewsets.ModelViewSet, RequestingUserPrivilegesMixin):
     serializer_class = EventTemplateRuleSerializer
-    queryset = EventTemplateRule.objects.all()
+    queryset = (
+        EventTemplateRule.objects.all()
+        .select_related("template")
+        .prefetch_related("exercises", "clauses__tags")
+    )
     permission_classes = [policies.EventTemplatePolicy]
 
     def get_queryset(self):
@@ -630,16 +672,50 @@ class EventParticipationViewSet(
     relevant events and update the statuses relative to the assessments
     """
 
-    queryset = (
-        EventParticipation.objects.all()
-        .select_related(
-            "user",
-            "event",
-        )
-        .with_prefetched_base_slots()
+    queryset = EventParticipation.objects.assigned().select_related(
+        "user",
+        "event",
     )
     permission_classes = [policies.EventParticipationPolicy]
     serializer_class = EventParticipationSerializer
+    # serialize the participation and slots returned by `retrieve`, `go_forward`,
+    # and `go_back` with the plain functions in `courses.read_serializers`,
+    # which return the same data as the serializers, without their overhead
+    use_read_serializers = True
+
+    def is_assessment_grid_request(self):
+        # the list of participations is being requested with all the details
+        # of their slots, e.g. by a teacher assessing the participations
+        return self.action == "list" and "include_details" in self.request.query_params
+
+    def is_normalized_request(self):
+        # exercises are listed separately from the slots referencing them, unless
+        # the flag is explicitly turned off, e.g. with `?normalized=0`
+        value = self.request.query_params.get("normalized")
+        return value is not None and value.lower() not in ("0", "false", "no")
+
+    def update_outdated_scores(self):
+        """
+        Assesses all the participations to the event in bulk if any of their
+        scores is outdated, instead of each slot being assessed on its own while
+        the participations are serialized
+        """
+        participations = EventParticipation.objects.filter(
+            event_id=self.kwargs["event_pk"]
+        ).assigned()
+        if EventParticipationSlot.objects.filter(
+            participation__in=participations, _auto_score_outdated=True
+        ).exists():
+            event = get_object_or_404(Event, pk=self.kwargs["event_pk"])
+            BatchAssessor(event).assess()
+
+    def get_object(self):
+        # the participation is needed several times while handling a request,
+        # e.g. by the policy and to build the serializers' context, so it's
+        # only fetched, along with its prefetched slots, once
+        if not hasattr(self, "_participation"):
+            self._participation = super().get_object()
+        return self._participation
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -703,8 +779,39 @@ class EventParticipationViewSet(
 
         return ret
 
+    def list(self, request, *args, **kwargs):
+        if self.is_assessment_grid_request() and self.kwargs.get("event_pk"):
+            self.update_outdated_scores()
+
+        if not self.is_normalized_request():
+            return super().list(request, *args, **kwargs)
+
+        # serialize each exercise once, instead of once for each slot it
+        # appears in, and have slots reference exercises by their id
+        exercises = {}
+        context = {
+            **self.get_serializer_context(),
+            EVENT_PARTICIPATION_SLOT_NORMALIZED_EXERCISES: exercises,
+        }
+        participations = self.get_serializer_class()(
+            self.filter_queryset(self.get_queryset()), many=True, context=context
+        ).data
+        return Response(
+            {
+                "participations": participations,
+                "exercises": get_exercise_fragments(
+                    list(exercises.values()), context
+                ),
+            }
+        )
+
     def get_queryset(self):
         qs = super().get_queryset()
+        qs = (
+            qs.with_prefetched_assessment_grid()
+            if self.is_assessment_grid_request()
+            else qs.with_prefetched_base_slots()
+        )
         try:
             if self.kwargs.get("event_pk") is not None:
                 # accessing as a nested view of event viewset
@@ -730,9 +837,15 @@ class EventParticipationViewSet(
             participation = self.get_queryset().get(user=request.user)
         except EventParticipation.DoesNotExist:
             try:
-                participation_pk = EventParticipation.objects.create(
-                    user=request.user, event_id=self.kwargs["event_pk"]
-                ).pk
+                # use a pre-generated participation if there's one available,
+                # otherwise create a new one on the fly
+                participation_pk = EventParticipation.objects.claim(
+                    event_id=self.kwargs["event_pk"], user=request.user
+                )
+                if participation_pk is None:
+                    participation_pk = EventParticipation.objects.create(
+                        user=request.user, event_id=self.kwargs["event_pk"]
+                    ).pk
                 participation = self.get_queryset().get(pk=participation_pk)
             except Event.DoesNotExist:
                 return Response(status=status.HTTP_404_NOT_FOUND)
@@ -742,41 +855,44 @@ class EventParticipationViewSet(
         )
         return Response(serializer.data)
 
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_read_serializers:
+            return super().retrieve(request, *args, **kwargs)
+
+        return Response(
+            serialize_event_participation(
+                self.get_object(), self.get_serializer_context()
+            )
+        )
+
+    def get_current_slot_data(self, participation):
+        current_slot = participation.current_slots[0]
+        share_participation_with_sub_slots(participation, [current_slot])
+        context = {
+            EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS: True,
+            EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE: True,
+            EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS: True,
+            **self.get_serializer_context(),
+        }
+        if self.use_read_serializers:
+            return serialize_event_participation_slot(current_slot, context)
+        return EventParticipationSlotSerializer(current_slot, context=context).data
+
     @action(detail=True, methods=["post"])
     def go_forward(self, request, **kwargs):
         # TODO make this idempotent (e.g. include the target slot number in request)
-        participation = self.get_queryset().get(pk=kwargs["pk"])
+        participation = self.get_object()
         participation.move_current_slot_cursor_forward()
 
-        current_slot = participation.current_slots[0]
-        serializer = EventParticipationSlotSerializer(
-            current_slot,
-            context={
-                EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS: True,
-                EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE: True,
-                EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS: True,
-                **self.get_serializer_context(),
-            },
-        )
-        return Response(serializer.data)
+        return Response(self.get_current_slot_data(participation))
 
     @action(detail=True, methods=["post"])
     def go_back(self, request, **kwargs):
         # TODO make this idempotent (e.g. include the target slot number in request)
-        participation = self.get_queryset().get(pk=kwargs["pk"])
+        participation = self.get_object()
         participation.move_current_slot_cursor_back()
 
-        current_slot = participation.current_slots[0]
-        serializer = EventParticipationSlotSerializer(
-            current_slot,
-            context={
-                EVENT_PARTICIPATION_SLOT_SHOW_DETAIL_FIELDS: True,
-                EVENT_PARTICIPATION_SLOT_SHOW_EXERCISE: True,
-                EVENT_PARTICIPATION_SLOT_SHOW_SUBMISSION_FIELDS: True,
-                **self.get_serializer_context(),
-            },
-        )
-        return Response(serializer.data)
+        return Response(self.get_current_slot_data(participation))
 
 
 class EventParticipationSlotViewSet(
@@ -848,8 +964,37 @@ class EventParticipationSlotViewSet(
     @action(detail=True, methods=["post"])
     def run(self, request, **kwargs):
         slot = self.get_object()
+
+        # unchanged code doesn't need to be run again
+        cached_results = get_cached_code_execution_results(slot=slot)
+        if cached_results is not None:
+            slot.execution_results = cached_results
+            slot.save(update_fields=["execution_results"])
+            serializer = self.get_serializer_class()(
+                slot, context=self.get_serializer_context()
+            )
+            return Response(serializer.data)
+
+        token = None
+        if is_slot_run_scheduling_enabled():
+            token = schedule_slot_run(slot.pk, slot.participation.user_id)
+            if token is None:
+                return Response(
+                    {"detail": "Too many code runs in progress"},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                )
+
         # schedule code execution
-        run_user_code_task.delay(slot.pk)
+        try:
+            run_user_code_task.apply_async(
+                args=[slot.pk, token],
+                queue=get_code_execution_queue(slot.exercise),
+                priority=get_code_execution_priority(slot.participation.event),
+            )
+        except Exception:
+            # the run won't ever complete: release its reservation
+            complete_slot_run(slot.pk, slot.participation.user_id, token)
+            raise
         # mark slot as running
         slot.execution_results = {
             **(slot.execution_results or {}),
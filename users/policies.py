@@ -1,5 +1,4 @@
 from courses.logic.privileges import UPDATE_COURSE, check_privilege
-from courses.models import Course
 from rest_access_policy import AccessPolicy
 
 
@@ -30,8 +29,7 @@ class UserPolicy(AccessPolicy):
         except KeyError:
             return False
 
-        course = Course.objects.get(pk=course_pk)
-        return check_privilege(request.user, course, UPDATE_COURSE)
+        return check_privilege(request.user, course_pk, UPDATE_COURSE)
 
     def is_personal_account(self, request, view, action):
         user = view.get_object()